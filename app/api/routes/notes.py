@@ -1,18 +1,48 @@
-from fastapi import APIRouter, HTTPException, status, UploadFile, Form, Query
+from fastapi import APIRouter, HTTPException, status, UploadFile, File, Form, Query, Response
+from fastapi.responses import StreamingResponse
 from tortoise.exceptions import DoesNotExist
 from tortoise.transactions import atomic
 
 from app.core.security import validate_access_token
-from app.schemas import NoteSchema, UserNotesSchema, SaveNoteSchema, RejectNoteSchema, FilterNotesSchema
+from app.schemas import (
+    NoteSchema, UserNotesSchema, NotesPageSchema, SaveNoteSchema, RejectNoteSchema, FilterNotesSchema, SignedUrlsSchema, ScanJobSchema
+)
 from app.models import Nota, Usuario, Categoria, Planilha
-from app.services.gcs import upload_to_gcs, exclude_from_gcs, generate_signed_url
-from app.services.scan import execute_scan
-from datetime import datetime, timedelta
+from app.services.gcs import (
+    upload_to_gcs_async, exclude_from_gcs_async, exclude_many_from_gcs_async, get_signed_url_async,
+    get_signed_urls_async, generate_upload_url_async, public_url
+)
+from app.core.config import SIGNED_URL_MAX_BATCH, NOTES_PAGE_SIZE
+from app.services.scan import execute_scan, ScanImage
+from app.services.workers import scan_slot
+from app.services.jobs import submit_job, get_job, get_job_por_token
+from app.services.report_cache import invalidar_relatorios
+from app.services.pagination import pagina_de_notas, em_utc
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+import asyncio
+import json
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/notes", tags=["notes"])
 
+CAMPOS_IMAGEM = ("url_image_original", "url_image_scan", "url_image_thumb", "url_image_medium")
+
+async def _assinar_imagens(notes) -> dict:
+    """URLs assinadas das imagens das notas (dicts de pagina_de_notas), indexadas pelo nome do blob."""
+    blob_names = [
+        note[campo].split("/")[-1]
+        for note in notes
+        for campo in CAMPOS_IMAGEM
+        if note.get(campo)
+    ]
+    return await get_signed_urls_async(blob_names)
+
 @router.post("/last")
-async def get_last_notes(request: UserNotesSchema):
+async def get_last_notes(request: NotesPageSchema):
 
     codigo_usuario = await validate_access_token(request.access_token)
 
@@ -21,14 +51,21 @@ async def get_last_notes(request: UserNotesSchema):
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuário não encontrado.")
 
-    last_notes = await Nota.filter(codigo_usuario=codigo_usuario).order_by("-created_at").limit(10)
+    last_notes, next_cursor = await pagina_de_notas(
+        Nota.filter(codigo_usuario=codigo_usuario), request.limite, request.cursor, request.campos,
+    )
 
-    if not last_notes:
+    if not last_notes and not request.cursor:
         raise HTTPException(status_code=204, detail="Não há notas para esse usuário.")
 
-    return {
-        "notes": last_notes
+    response = {
+        "notes": last_notes,
+        "next_cursor": next_cursor
     }
+    if request.assinar_urls:
+        response["signed_urls"] = await _assinar_imagens(last_notes)
+
+    return response
 
 @router.post("/history")
 async def filter_notes(request: FilterNotesSchema):
@@ -63,16 +100,35 @@ async def filter_notes(request: FilterNotesSchema):
                 detail=f"Período inválido: {request.periodo}. Opções válidas: {', '.join(days.keys())}."
             )
 
-        start_date = datetime.utcnow() - timedelta(days=days[request.periodo])
+        start_date = datetime.now(timezone.utc) - timedelta(days=days[request.periodo])
         filters["created_at__gte"] = start_date
 
-    notes = await Nota.filter(**filters).order_by("-created_at")
+    # Intervalos livres; criado_de, quando informado, prevalece sobre o período
+    if request.criado_de:
+        filters["created_at__gte"] = em_utc(request.criado_de)
+    if request.criado_ate:
+        filters["created_at__lte"] = em_utc(request.criado_ate)
+    if request.data_de:
+        filters["data__gte"] = request.data_de
+    if request.data_ate:
+        filters["data__lte"] = request.data_ate
+    if request.categorias:
+        filters["codigo_categoria_id__in"] = request.categorias
+
+    notes, next_cursor = await pagina_de_notas(
+        Nota.filter(**filters), request.limite if request.limite is not None else NOTES_PAGE_SIZE, request.cursor, request.campos,
+    )
 
-    return {
+    response = {
         "sheet_id": sheet.id,
         "codigo_planilha": request.codigo_planilha,
-        "notes": notes or []
+        "notes": notes,
+        "next_cursor": next_cursor
     }
+    if request.assinar_urls:
+        response["signed_urls"] = await _assinar_imagens(notes)
+
+    return response
 
 @router.post("/signed-url")
 async def get_signed_url(
@@ -92,7 +148,7 @@ async def get_signed_url(
 
     try:
         # Gera a URL assinada
-        signed_url = generate_signed_url(blob_name)
+        signed_url = await get_signed_url_async(blob_name)
         return {"signed_url": signed_url}
     except Exception as e:
         raise HTTPException(
@@ -100,6 +156,25 @@ async def get_signed_url(
             detail=f"Erro ao gerar URL assinada: {str(e)}"
         )
 
+@router.post("/signed-urls")
+async def get_signed_urls(request: SignedUrlsSchema):
+    """
+    Gera URLs assinadas para vários arquivos numa única chamada.
+    """
+    codigo_usuario = await validate_access_token(request.access_token)
+
+    user_exists = await Usuario.filter(codigo_usuario=codigo_usuario).exists()
+    if not user_exists:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuário não encontrado.")
+
+    if len(request.blob_names) > SIGNED_URL_MAX_BATCH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Máximo de {SIGNED_URL_MAX_BATCH} arquivos por chamada."
+        )
+
+    return {"signed_urls": await get_signed_urls_async(request.blob_names)}
+
 @router.post("/count")
 async def count_notes(request: UserNotesSchema):
 
@@ -114,20 +189,108 @@ async def count_notes(request: UserNotesSchema):
 
     return {"total_notes": total_notes}
 
+async def _processar_imagem(image: Optional[ScanImage] = None, blob_name: Optional[str] = None, on_stage=None):
+    """
+    Envia a imagem original ao bucket enquanto a digitalização roda.
+
+    O upload da original não depende do OCR, então os dois ramos correm em
+    paralelo e a latência total é a do mais lento. Se algum falhar, a original
+    já enviada é removida e o primeiro erro é repassado.
+
+    Com `blob_name`, a original já foi enviada direto ao bucket pelo cliente e
+    os bytes são baixados apenas para o OCR.
+    """
+    if blob_name:
+        if on_stage:
+            on_stage("download_original")
+        try:
+            image = await ScanImage.from_blob(blob_name)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+        data = await execute_scan(image, on_stage=on_stage)
+        logger.info("digitalização concluída", extra={"metricas": image.metricas})
+        return public_url(blob_name), data
+
+    async def enviar_original():
+        with image.medir("upload_original"):
+            return await upload_to_gcs_async(image)
+
+    if on_stage:
+        on_stage("upload_original")
+
+    url_image_original, data = await asyncio.gather(
+        enviar_original(),
+        execute_scan(image, on_stage=on_stage),
+        return_exceptions=True,
+    )
+
+    # upload_to_gcs_async levanta exceção se o envio falhar, então uma falha em
+    # qualquer ramo aparece aqui e o que o outro ramo já enviou é removido
+    erros = [r for r in (url_image_original, data) if isinstance(r, BaseException)]
+    if erros:
+        if isinstance(url_image_original, str):
+            try:
+                await exclude_from_gcs_async(url_image_original)
+            except HTTPException as e:
+                logger.warning("erro ao remover imagem original órfã", extra={"erro": e.detail})
+        if isinstance(data, dict):
+            derivadas = [data[campo] for campo in ("imagem_url", "imagem_thumb_url", "imagem_medium_url") if data.get(campo)]
+            await exclude_many_from_gcs_async(derivadas)
+        raise erros[0]
+
+    logger.info("digitalização concluída", extra={"metricas": image.metricas})
+    return url_image_original, data
+
+@router.post("/upload-url")
+async def get_upload_url(
+    access_token: str = Form(...),
+    content_type: str = Form("image/jpeg"),
+    resumable: bool = Form(False)
+):
+    """
+    Gera o destino para o cliente enviar a imagem original direto ao bucket.
+
+    Depois do envio, o cliente chama /notes/process com o `blob_name` devolvido
+    em vez de reenviar o arquivo pela API.
+    """
+    codigo_usuario = await validate_access_token(access_token)
+
+    if content_type not in ["image/jpeg", "image/png"]:
+        raise HTTPException(status_code=400, detail="Formato de arquivo não suportado.")
+
+    user_exists = await Usuario.filter(codigo_usuario=codigo_usuario).exists()
+    if not user_exists:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuário não encontrado.")
+
+    return await generate_upload_url_async(content_type, resumable)
+
 @router.post("/process")
 async def process_note(
-    image: UploadFile, 
+    response: Response,
+    image: Optional[UploadFile] = File(None), 
+    blob_name: Optional[str] = Form(None),
     access_token: str = Form(...), 
     codigo_categoria: str = Form(...), 
     codigo_planilha: str = Form(...), 
-    descricao: str = Form(...)
+    descricao: str = Form(...),
+    assincrono: bool = Form(False)
     ):
 
     codigo_usuario = await validate_access_token(access_token)
 
-    if image.content_type not in ["image/jpeg", "image/png"]:
+    if image is None and not blob_name:
+        raise HTTPException(status_code=400, detail="Envie a imagem ou o blob_name de um upload direto.")
+
+    if image is not None and image.content_type not in ["image/jpeg", "image/png"]:
         raise HTTPException(status_code=400, detail="Formato de arquivo não suportado.")
 
+    if image is None:
+        try:
+            uuid.UUID(blob_name)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="blob_name inválido.")
+
     try:
         user = await Usuario.get(codigo_usuario=codigo_usuario)
     except DoesNotExist:
@@ -143,19 +306,79 @@ async def process_note(
     except DoesNotExist:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Planilha não encontrada.")
 
-    url_image_original = upload_to_gcs(image)
-    data = execute_scan(image)
+    def montar_resposta(url_image_original, data):
+        return {
+            "valor": data.get("valor_pago"),
+            "data": data.get("data_extraida"),
+            "descricao": descricao,
+            "url_image_original": url_image_original,
+            "url_image_scan": data.get("imagem_url"),
+            "url_image_thumb": data.get("imagem_thumb_url"),
+            "url_image_medium": data.get("imagem_medium_url"),
+            "codigo_usuario": codigo_usuario,
+            "codigo_planilha": codigo_planilha,
+            "codigo_categoria": codigo_categoria,
+        }
+
+    # Os bytes são lidos uma única vez e compartilhados por upload, OCR e OpenCV.
+    # Como o UploadFile é fechado ao fim da requisição, o job também usa essa cópia.
+    scan_image = None
+    if image is not None:
+        blob_name = None
+        try:
+            scan_image = await ScanImage.from_upload(image)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    if assincrono:
+        async def tarefa(job):
+            url_image_original, data = await _processar_imagem(
+                scan_image, blob_name, on_stage=lambda etapa: job.atualizar(etapa=etapa)
+            )
+            return montar_resposta(url_image_original, data)
+
+        job = submit_job(codigo_usuario, tarefa)
+        response.status_code = status.HTTP_202_ACCEPTED
+        # O token do stream só é entregue aqui, a quem criou o job
+        return {**job.to_dict(), "stream_token": job.token_stream}
 
-    return {
-        "valor": data.get("valor_pago"),
-        "data": data.get("data_extraida"),
-        "descricao": descricao,
-        "url_image_original": url_image_original,
-        "url_image_scan": data.get("imagem_url"),
-        "codigo_usuario": codigo_usuario,
-        "codigo_planilha": codigo_planilha,
-        "codigo_categoria": codigo_categoria,
-    }
+    # Upload e digitalização rodam fora do event loop, com fila limitada
+    async with scan_slot():
+        url_image_original, data = await _processar_imagem(scan_image, blob_name)
+
+    return montar_resposta(url_image_original, data)
+
+@router.post("/jobs")
+async def get_scan_job(request: ScanJobSchema):
+
+    codigo_usuario = await validate_access_token(request.access_token)
+
+    return get_job(request.job_id, codigo_usuario).to_dict()
+
+@router.get("/jobs/{job_id}/stream")
+async def stream_scan_job(job_id: str, token: str = Query(...)):
+    """
+    Acompanha um job via Server-Sent Events: um evento a cada mudança de etapa,
+    encerrando quando o job é concluído ou falha.
+
+    O EventSource não envia cabeçalhos nem corpo, então a autorização é o
+    `stream_token` devolvido na criação do job: vale só para ele e só por
+    JOB_STREAM_TOKEN_TTL segundos, e nunca o token de acesso do usuário.
+    """
+    job = get_job_por_token(job_id, token)
+
+    async def eventos():
+        while True:
+            # Estado, versão e fim lidos juntos: o que mudar durante o envio fica
+            # para a próxima volta, e o estado final é sempre enviado
+            versao, estado, finalizado = job.versao, job.to_dict(), job.finalizado
+            yield f"data: {json.dumps(estado, default=str)}\n\n"
+            if finalizado:
+                break
+            while not await job.aguardar_mudanca(versao, timeout=15):
+                yield ": keepalive\n\n"
+
+    return StreamingResponse(eventos(), media_type="text/event-stream")
 
 @router.post("/confirm")
 @atomic()
@@ -209,25 +432,32 @@ async def confirm_note(request: SaveNoteSchema):
         planilha_id=sheet.id,
         url_image_original=request.url_image_original,
         url_image_scan=request.url_image_scan,
+        url_image_thumb=request.url_image_thumb,
+        url_image_medium=request.url_image_medium,
     )
 
     user.caixa -= valor_centavos
     await user.save()
 
+    # O relatório em cache desta planilha deixou de refletir as notas
+    await invalidar_relatorios(codigo_usuario, sheet.codigo_planilha)
+
     return {"message": "Nota salva com sucesso!"}
 
 @router.post("/reject")
-async def reject_note(request: RejectNoteSchema):
+async def reject_note(request: RejectNoteSchema, response: Response):
     # Valida o token
     _ = await validate_access_token(request.access_token)
 
-    for image_url in request.image_urls:
-        try:
-            exclude_from_gcs(image_url)
-        except HTTPException as e:
-            raise HTTPException(
-                status_code=e.status_code,
-                detail=f"Erro ao excluir a imagem {image_url}: {e.detail}"
-            )
+    resultados = await exclude_many_from_gcs_async(request.image_urls)
+
+    # Imagens que já não existiam também contam como rejeitadas
+    falhas = [r for r in resultados if r["status"] == "erro"]
+    if falhas:
+        response.status_code = status.HTTP_207_MULTI_STATUS
+        return {
+            "message": f"{len(falhas)} de {len(resultados)} imagens não puderam ser excluídas.",
+            "resultados": resultados,
+        }
 
-    return {"message": "Imagens rejeitadas e excluídas com sucesso."}
\ No newline at end of file
+    return {"message": "Imagens rejeitadas e excluídas com sucesso.", "resultados": resultados}
@@ -1,23 +1,35 @@
 from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import StreamingResponse
 from tortoise.exceptions import DoesNotExist
 
 from app.schemas import ReportSchema
-from app.models import Planilha
 from app.core.security import validate_access_token
 from app.services.report import criar_pdf_nota_fiscal
 
 router = APIRouter(prefix="/reports", tags=["reports"])
 
+# Tamanho dos blocos em que o PDF é enviado ao cliente
+BLOCO_PDF = 64 * 1024
+
+def _em_blocos(dados: bytes):
+    view = memoryview(dados)
+    for inicio in range(0, len(view), BLOCO_PDF):
+        yield view[inicio:inicio + BLOCO_PDF]
+
 @router.post("/")
 async def create_report(request: ReportSchema):
 
     codigo_usuario = await validate_access_token(request.access_token)
 
-    sheet = await Planilha.filter(codigo_planilha=request.codigo_planilha, codigo_usuario=codigo_usuario).first()
-
-    if not sheet:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Essa planilha não existe para esse usuário.")
-
-    await criar_pdf_nota_fiscal(codigo_usuario, request.codigo_planilha)
-
-    return {"message": "Relatório criado com sucesso!"}
\ No newline at end of file
+    # A planilha é validada na mesma consulta que busca os agregados do relatório (400 se não existir).
+    # Lido do cache de relatórios ou renderizado na thread de relatórios, sem passar pelo diretório de trabalho
+    pdf, nome_arquivo = await criar_pdf_nota_fiscal(codigo_usuario, request.codigo_planilha)
+
+    return StreamingResponse(
+        _em_blocos(pdf),
+        media_type="application/pdf",
+        headers={
+            "Content-Disposition": f'attachment; filename="{nome_arquivo}"',
+            "Content-Length": str(len(pdf)),
+        },
+    )
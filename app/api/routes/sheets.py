@@ -1,9 +1,11 @@
 from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import StreamingResponse
 from tortoise.exceptions import DoesNotExist
 
 from app.core.security import validate_access_token
-from app.schemas import SheetSchema, GetSheetSchema
+from app.schemas import SheetSchema, GetSheetSchema, ExportSheetSchema
 from app.models import Planilha, Usuario
+from app.services.export import FORMATOS, nome_exportacao
 
 router = APIRouter(prefix="/sheets", tags=["sheets"])
 
@@ -38,4 +40,31 @@ async def get_last_sheet(request: GetSheetSchema):
     return {
         "id": last_sheet.id,
         "codigo_planilha": last_sheet.codigo_planilha
-    }
\ No newline at end of file
+    }
+
+@router.post("/export")
+async def export_sheet(request: ExportSheetSchema):
+    """
+    Exporta as notas da planilha em CSV (padrão) ou XLSX.
+
+    O arquivo é gerado enquanto é enviado, um bloco de notas por vez, então não
+    tem Content-Length e a memória usada não depende do tamanho da planilha.
+    """
+    codigo_usuario = await validate_access_token(request.access_token)
+
+    if request.formato not in FORMATOS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Formato inválido. Use um de: {', '.join(FORMATOS)}.")
+
+    sheet = await Planilha.filter(codigo_planilha=request.codigo_planilha, codigo_usuario=codigo_usuario).first()
+
+    if not sheet:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Essa planilha não existe para esse usuário.")
+
+    media_type, exportar = FORMATOS[request.formato]
+    nome_arquivo = nome_exportacao(codigo_usuario, request.codigo_planilha, request.formato)
+
+    return StreamingResponse(
+        exportar(sheet.id),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{nome_arquivo}"'},
+    )
@@ -1,5 +1,6 @@
 from dotenv import load_dotenv
 import os
+import tempfile
 
 load_dotenv()
 
@@ -21,4 +22,86 @@ TORTOISE_ORM = {
     },
     "use_tz": True,
     "timezone": "America/Sao_Paulo",
-}
\ No newline at end of file
+}
+
+# Pool de workers para as etapas bloqueantes da digitalização (OpenCV, Vision, GCS)
+SCAN_WORKERS = int(os.getenv('SCAN_WORKERS', os.cpu_count() or 4))
+SCAN_POOL = os.getenv('SCAN_POOL', 'thread')  # 'thread' ou 'process' para as etapas de CPU
+SCAN_QUEUE_SIZE = int(os.getenv('SCAN_QUEUE_SIZE', 16))
+SCAN_RETRY_AFTER = int(os.getenv('SCAN_RETRY_AFTER', 5))
+
+# Jobs assíncronos de digitalização (modo submit-then-poll de /notes/process)
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', SCAN_WORKERS))
+JOB_QUEUE_SIZE = int(os.getenv('JOB_QUEUE_SIZE', 64))
+JOB_TTL = int(os.getenv('JOB_TTL', 3600))  # segundos que um job finalizado fica disponível para consulta
+JOB_STREAM_TOKEN_TTL = int(os.getenv('JOB_STREAM_TOKEN_TTL', 300))  # segundos, a partir da criação, para abrir o stream
+
+# Orçamento da imagem enviada ao OCR (0 desativa o limite correspondente). Desligado por
+# padrão: a redução só deve ser ativada depois de medida com benchmarks.ocr_budget em notas reais
+OCR_MAX_PIXELS = int(os.getenv('OCR_MAX_PIXELS', 0))
+OCR_MAX_BYTES = int(os.getenv('OCR_MAX_BYTES', 0))
+OCR_JPEG_QUALITY = int(os.getenv('OCR_JPEG_QUALITY', 85))
+
+# Cache de resultados de OCR por SHA-256 da imagem
+OCR_CACHE_MAX_BYTES = int(os.getenv('OCR_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+OCR_CACHE_TTL = int(os.getenv('OCR_CACHE_TTL', 3600))  # segundos no cache em memória
+OCR_CACHE_DB_TTL_DAYS = int(os.getenv('OCR_CACHE_DB_TTL_DAYS', 30))
+
+# Google Vision: endpoint (pode apontar para um servidor local em testes) e agrupamento de requisições
+VISION_URL = os.getenv('VISION_URL', 'https://vision.googleapis.com')
+VISION_BATCH_WINDOW_MS = int(os.getenv('VISION_BATCH_WINDOW_MS', 20))
+VISION_BATCH_SIZE = int(os.getenv('VISION_BATCH_SIZE', 16))  # limite da API por chamada
+VISION_BATCH_MAX_BYTES = int(os.getenv('VISION_BATCH_MAX_BYTES', 8 * 1024 * 1024))
+VISION_CONNECT_TIMEOUT = float(os.getenv('VISION_CONNECT_TIMEOUT', 5))
+VISION_READ_TIMEOUT = float(os.getenv('VISION_READ_TIMEOUT', 30))
+VISION_MAX_CONNECTIONS = int(os.getenv('VISION_MAX_CONNECTIONS', 20))
+VISION_MAX_RETRIES = int(os.getenv('VISION_MAX_RETRIES', 3))
+VISION_BACKOFF_BASE = float(os.getenv('VISION_BACKOFF_BASE', 0.5))  # segundos, dobra a cada tentativa
+VISION_BREAKER_FAILURES = int(os.getenv('VISION_BREAKER_FAILURES', 5))
+VISION_BREAKER_COOLDOWN = int(os.getenv('VISION_BREAKER_COOLDOWN', 30))
+VISION_RATE_LIMIT = float(os.getenv('VISION_RATE_LIMIT', 10))  # imagens por segundo (0 desativa)
+# Resposta parcial: só os campos usados (vértices dos blocos, caixas e texto das palavras); vazio desativa
+VISION_FIELDS = os.getenv(
+    'VISION_FIELDS',
+    'responses(error,fullTextAnnotation(text,pages(blocks(boundingBox,paragraphs(words(boundingBox,symbols/text))))))',
+)
+
+# Google Cloud Storage: endpoint alternativo (ex.: emulador local) e projeto usado com ele
+GCS_ENDPOINT = os.getenv('GCS_ENDPOINT')
+GCS_PROJECT = os.getenv('GCS_PROJECT', 'registranota')
+
+# Limite de tamanho das imagens recebidas e tamanho dos blocos lidos do upload
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', 15 * 1024 * 1024))
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 64 * 1024))
+
+# URLs assinadas de leitura: validade, antecedência para renovar e tamanho do cache
+SIGNED_URL_EXPIRATION = int(os.getenv('SIGNED_URL_EXPIRATION', 30))  # minutos
+SIGNED_URL_RENEW_BEFORE = int(os.getenv('SIGNED_URL_RENEW_BEFORE', 5))  # minutos
+SIGNED_URL_CACHE_SIZE = int(os.getenv('SIGNED_URL_CACHE_SIZE', 10000))
+SIGNED_URL_MAX_BATCH = int(os.getenv('SIGNED_URL_MAX_BATCH', 200))
+
+# Derivados gerados na digitalização para as listagens (miniatura e versão média)
+SCAN_JPEG_QUALITY = int(os.getenv('SCAN_JPEG_QUALITY', 90))
+THUMB_MAX_SIDE = int(os.getenv('THUMB_MAX_SIDE', 256))
+MEDIUM_MAX_SIDE = int(os.getenv('MEDIUM_MAX_SIDE', 1024))
+DERIVATIVE_FORMAT = os.getenv('DERIVATIVE_FORMAT', 'webp')  # 'webp' ou 'jpeg' (progressivo)
+DERIVATIVE_QUALITY = int(os.getenv('DERIVATIVE_QUALITY', 75))
+
+# Inclinação (em graus) abaixo da qual o recorte é feito sem transformação de perspectiva
+SKEW_TOLERANCE_DEGREES = float(os.getenv('SKEW_TOLERANCE_DEGREES', 2))
+
+# Logs estruturados (JSON, uma linha por evento) e endpoint /metrics
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+
+# Cache de relatórios em PDF no disco local, com limite de tamanho (os mais antigos saem primeiro)
+REPORT_CACHE_DIR = os.getenv('REPORT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'registranota-relatorios'))
+REPORT_CACHE_MAX_BYTES = int(os.getenv('REPORT_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+# Geração de relatórios: threads dedicadas e notas lidas do banco em blocos
+REPORT_WORKERS = int(os.getenv('REPORT_WORKERS', 2))
+REPORT_CHUNK_SIZE = int(os.getenv('REPORT_CHUNK_SIZE', 2000))
+
+# Listas de notas (/notes/history e /notes/last): tamanho padrão e máximo das páginas
+NOTES_PAGE_SIZE = int(os.getenv('NOTES_PAGE_SIZE', 50))
+NOTES_PAGE_MAX = int(os.getenv('NOTES_PAGE_MAX', 200))
@@ -0,0 +1,42 @@
+"""
+Logs estruturados: um objeto JSON por linha, com o id de correlação da requisição.
+
+Os módulos usam `logging.getLogger(__name__)` normalmente; campos adicionais vão
+em `extra={...}` e aparecem como chaves do JSON.
+"""
+import json
+import logging
+import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from app.core.config import LOG_LEVEL
+
+# Preenchido pelo RequestTimingMiddleware (ou pelo worker do job) e lido por cada linha de log
+correlation_id: ContextVar[str] = ContextVar("correlation_id", default="-")
+
+# Atributos próprios do LogRecord; o resto veio de `extra`
+_ATRIBUTOS_PADRAO = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        evento = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "correlation_id": correlation_id.get(),
+        }
+        evento.update({k: v for k, v in vars(record).items() if k not in _ATRIBUTOS_PADRAO})
+        if record.exc_info:
+            evento["exc"] = self.formatException(record.exc_info)
+        return json.dumps(evento, ensure_ascii=False, default=str)
+
+def configurar_logs():
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter())
+
+    logger = logging.getLogger("app")
+    logger.handlers[:] = [handler]
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
@@ -0,0 +1,172 @@
+"""
+Métricas da aplicação no formato de texto do Prometheus.
+
+Contadores, gauges e histogramas simples, seguros para uso a partir dos pools
+de threads. Métricas com `funcao` são lidas no momento da coleta (estado que já
+existe em outro lugar, como o tamanho de um cache). `render()` gera o corpo do
+endpoint /metrics.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_registro = []
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _formatar(numero) -> str:
+    if numero == float("inf"):
+        return "+Inf"
+    return repr(float(numero)) if isinstance(numero, float) else str(numero)
+
+class _Metrica:
+    tipo = "untyped"
+
+    def __init__(self, nome: str, descricao: str, rotulos: tuple = (), funcao=None):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = tuple(rotulos)
+        self.funcao = funcao
+        self._valores = {}
+        self._lock = threading.Lock()
+        _registro.append(self)
+
+    def _chave(self, rotulos: dict) -> tuple:
+        return tuple(str(rotulos.get(rotulo, "")) for rotulo in self.rotulos)
+
+    def _rotulos(self, chave: tuple, extra: dict | None = None) -> str:
+        pares = list(zip(self.rotulos, chave)) + list((extra or {}).items())
+        if not pares:
+            return ""
+        return "{" + ",".join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares) + "}"
+
+    def _coletar(self) -> dict:
+        if self.funcao is None:
+            with self._lock:
+                return dict(self._valores)
+
+        valores = self.funcao()
+        if not isinstance(valores, dict):
+            return {(): valores}
+        return {chave if isinstance(chave, tuple) else (chave,): valor for chave, valor in valores.items()}
+
+    def amostras(self) -> list[str]:
+        return [f"{self.nome}{self._rotulos(chave)} {_formatar(valor)}"
+                for chave, valor in sorted(self._coletar().items())]
+
+class Counter(_Metrica):
+    tipo = "counter"
+
+    def inc(self, valor: float = 1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+class Gauge(_Metrica):
+    tipo = "gauge"
+
+    def set(self, valor: float, **rotulos):
+        with self._lock:
+            self._valores[self._chave(rotulos)] = valor
+
+    def inc(self, valor: float = 1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def dec(self, valor: float = 1, **rotulos):
+        self.inc(-valor, **rotulos)
+
+class Histogram(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome: str, descricao: str, rotulos: tuple = (), buckets: tuple = BUCKETS_SEGUNDOS):
+        super().__init__(nome, descricao, rotulos)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, valor: float, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            contagens, soma = self._valores.get(chave, ([0] * len(self.buckets), 0.0))
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    contagens[i] += 1
+            self._valores[chave] = (contagens, soma + valor)
+
+    @contextmanager
+    def tempo(self, **rotulos):
+        """Observa a duração do bloco, em segundos, mesmo se ele falhar."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - inicio, **rotulos)
+
+    def amostras(self) -> list[str]:
+        linhas = []
+        for chave, (contagens, soma) in sorted(self._coletar().items()):
+            for limite, contagem in zip(self.buckets, contagens):
+                linhas.append(f"{self.nome}_bucket{self._rotulos(chave, {'le': _formatar(limite)})} {contagem}")
+            linhas.append(f"{self.nome}_sum{self._rotulos(chave)} {_formatar(soma)}")
+            linhas.append(f"{self.nome}_count{self._rotulos(chave)} {contagens[-1]}")
+        return linhas
+
+def cronometrar(histograma: Histogram, **rotulos):
+    """Decorador que observa a duração de cada chamada da função no histograma."""
+    def decorador(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with histograma.tempo(**rotulos):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorador
+
+def render() -> str:
+    linhas = []
+    for metrica in _registro:
+        linhas.append(f"# HELP {metrica.nome} {metrica.descricao}")
+        linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+        linhas.extend(metrica.amostras())
+    return "\n".join(linhas) + "\n"
+
+# Requisições HTTP, preenchidas pelo RequestTimingMiddleware
+http_duracao = Histogram(
+    "http_request_duration_seconds", "Duração das requisições HTTP.", ("metodo", "rota", "status"),
+)
+http_consultas = Histogram(
+    "http_request_db_queries", "Consultas ao banco feitas por requisição.", ("rota",),
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100),
+)
+
+# Consultas ao banco: o Tortoise registra cada consulta no logger tortoise.db_client
+db_consultas = Counter("db_queries_total", "Consultas executadas pelo Tortoise.")
+_consultas_requisicao: ContextVar[list | None] = ContextVar("consultas_requisicao", default=None)
+
+class _ContadorConsultas(logging.Handler):
+    def emit(self, record):
+        if isinstance(record.msg, str) and record.msg.startswith(("Created", "Closed")):
+            return  # abertura e fechamento de conexões, não consultas
+        db_consultas.inc()
+        contador = _consultas_requisicao.get()
+        if contador is not None:
+            contador[0] += 1
+
+def instrumentar_banco():
+    logger = logging.getLogger("tortoise.db_client")
+    if not any(isinstance(handler, _ContadorConsultas) for handler in logger.handlers):
+        logger.addHandler(_ContadorConsultas())
+    logger.setLevel(logging.DEBUG)
+    # As consultas são só contadas; o texto delas não vai para os logs da aplicação
+    logger.propagate = False
+
+def iniciar_contagem_consultas() -> list:
+    """Passa a contar as consultas do contexto atual (a requisição); devolve o contador."""
+    contador = [0]
+    _consultas_requisicao.set(contador)
+    return contador
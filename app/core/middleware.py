@@ -0,0 +1,105 @@
+import logging
+import time
+import uuid
+from fastapi import HTTPException, status
+from starlette.responses import JSONResponse
+
+from app.core.logs import correlation_id
+from app.core.metrics import http_duracao, http_consultas, iniciar_contagem_consultas
+
+logger = logging.getLogger(__name__)
+
+# Folga para os demais campos do formulário multipart além da imagem
+MARGEM_MULTIPART = 64 * 1024
+
+class UploadSizeLimitMiddleware:
+    """
+    Rejeita com 413 corpos maiores que `max_bytes` nas rotas de upload.
+
+    Verifica o Content-Length antes de ler qualquer byte e, para corpos sem
+    Content-Length (chunked), conta os bytes à medida que chegam, interrompendo
+    a leitura assim que o limite é ultrapassado.
+    """
+
+    def __init__(self, app, max_bytes: int, paths: list[str]):
+        self.app = app
+        self.max_bytes = max_bytes + MARGEM_MULTIPART
+        self.paths = tuple(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        detalhe = f"Arquivo maior que o limite de {self.max_bytes - MARGEM_MULTIPART} bytes."
+
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            response = JSONResponse({"detail": detalhe}, status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+            await response(scope, receive, send)
+            return
+
+        recebidos = 0
+
+        async def receive_limitado():
+            nonlocal recebidos
+            message = await receive()
+            if message["type"] == "http.request":
+                recebidos += len(message.get("body", b""))
+                if recebidos > self.max_bytes:
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=detalhe)
+            return message
+
+        await self.app(scope, receive_limitado, send)
+
+
+class RequestTimingMiddleware:
+    """
+    Mede cada requisição HTTP e associa a ela um id de correlação.
+
+    O id vem do cabeçalho X-Request-ID (ou é gerado), é devolvido na resposta e
+    aparece em todas as linhas de log emitidas durante a requisição. A duração e
+    o número de consultas ao banco são registrados por rota, usando o caminho
+    declarado (/notes/jobs/{job_id}/stream) e não o caminho real, para limitar os rótulos.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex
+        token = correlation_id.set(request_id)
+        consultas = iniciar_contagem_consultas()
+        status_code = 500
+        inicio = time.perf_counter()
+
+        async def send_com_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_com_id)
+        finally:
+            duracao = time.perf_counter() - inicio
+            route = scope.get("route")
+            rota = getattr(route, "path_format", None) or getattr(route, "path", None) or "desconhecida"
+
+            http_duracao.observe(duracao, metodo=scope["method"], rota=rota, status=status_code)
+            http_consultas.observe(consultas[0], rota=rota)
+            logger.info("requisicao", extra={
+                "metodo": scope["method"],
+                "rota": rota,
+                "status": status_code,
+                "duracao_ms": round(duracao * 1000, 1),
+                "consultas_banco": consultas[0],
+            })
+            correlation_id.reset(token)
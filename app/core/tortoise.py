@@ -1,10 +1,13 @@
+import logging
 from tortoise import Tortoise
 from app.core.config import TORTOISE_ORM
 
+logger = logging.getLogger(__name__)
+
 async def init_db():
     await Tortoise.init(config=TORTOISE_ORM)
     await Tortoise.generate_schemas()
-    print("Banco de dados inicializado.")
+    logger.info("banco de dados inicializado")
 
 async def close_db():
     await Tortoise.close_connections()
\ No newline at end of file
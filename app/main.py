@@ -1,20 +1,56 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from tortoise.contrib.fastapi import register_tortoise
 from app.api.main import api_router
-from app.core.config import TORTOISE_ORM
+from app.core.config import TORTOISE_ORM, UPLOAD_MAX_BYTES, METRICS_ENABLED
+from app.core.logs import configurar_logs
+from app.core.metrics import instrumentar_banco, render
+from app.core.middleware import UploadSizeLimitMiddleware, RequestTimingMiddleware
+from app.services.workers import start_workers, shutdown_workers
+from app.services.jobs import start_job_workers, stop_job_workers
+from app.services.vision import start_vision_client, close_vision_client
+from app.services.gcs import init_storage
 
 from datetime import datetime
 import pytz
 
 SP_TZ = pytz.timezone('America/Sao_Paulo')
 
+configurar_logs()
+instrumentar_banco()
+
 app = FastAPI()
 
 app.include_router(api_router, prefix="/api/v1")
 
+app.add_middleware(UploadSizeLimitMiddleware, max_bytes=UPLOAD_MAX_BYTES, paths=["/api/v1/notes/process"])
+# Adicionado por último para ficar por fora: mede também as respostas 413 do limite de upload
+app.add_middleware(RequestTimingMiddleware)
+
 register_tortoise(
     app,
     config=TORTOISE_ORM,
     generate_schemas=True,
     add_exception_handlers=True,
 )
+
+
+@app.on_event("startup")
+async def startup_scan_jobs():
+    await start_vision_client()
+    await init_storage()
+    start_workers()
+    start_job_workers()
+
+
+@app.on_event("shutdown")
+async def shutdown_scan_workers():
+    await stop_job_workers()
+    shutdown_workers()
+    await close_vision_client()
+
+
+if METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
@@ -14,6 +14,8 @@ class Nota(Model):
     id = fields.IntField(pk=True)
     url_image_original = fields.CharField(max_length=255)
     url_image_scan = fields.CharField(max_length=255)
+    url_image_thumb = fields.CharField(max_length=255, null=True)
+    url_image_medium = fields.CharField(max_length=255, null=True)
     data = fields.DateField()
     valor = fields.IntField()
     descricao = fields.CharField(max_length=255)
@@ -25,6 +27,8 @@ class Nota(Model):
 
     class Meta:
         table = "notas"
+        # Paginação por chave (created_at, id) nas listas por planilha e por usuário
+        indexes = (("planilha_id", "created_at", "id"), ("codigo_usuario_id", "created_at", "id"))
 
 class Usuario(Model):
     codigo_usuario = fields.CharField(pk=True, max_length=20)
@@ -59,4 +63,14 @@ class RefreshToken(Model):
     usuario = fields.ForeignKeyField("models.Usuario", related_name="refresh_tokens", on_delete=fields.CASCADE)
 
     class Meta:
-        table = "refresh_tokens"
\ No newline at end of file
+        table = "refresh_tokens"
+
+class ResultadoOcr(Model):
+    sha256 = fields.CharField(pk=True, max_length=64)
+    vertices = fields.JSONField()
+    texto = fields.TextField()
+    linhas = fields.JSONField(null=True)
+    updated_at = fields.DatetimeField(auto_now=True, db_index=True)  # validade e limpeza dos expirados
+
+    class Meta:
+        table = "ocr_cache"
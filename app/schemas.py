@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from datetime import date
+from datetime import date, datetime
 from typing import List, Optional
 
 class UserSchema(BaseModel):
@@ -68,6 +68,15 @@ class SaveNoteSchema(BaseModel):
     codigo_planilha: str
     url_image_original: str
     url_image_scan: str
+    url_image_thumb: Optional[str] = None
+    url_image_medium: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class ScanJobSchema(BaseModel):
+    access_token: str
+    job_id: str
 
     class Config:
         from_attributes = True
@@ -85,10 +94,25 @@ class UserNotesSchema(BaseModel):
     class Config:
         from_attributes = True
 
-class FilterNotesSchema(BaseModel):
-    access_token: str
+class NotesPageSchema(UserNotesSchema):
+    assinar_urls: bool = False
+    limite: int = 10
+    cursor: Optional[str] = None  # next_cursor da página anterior
+    campos: Optional[List[str]] = None  # colunas a devolver; todas se omitido
+
+class FilterNotesSchema(NotesPageSchema):
     codigo_planilha: str
-    periodo: Optional[str] = None
+    periodo: Optional[str] = None  # atalho para criado_de (ultimos_7_dias, ultimo_mes...)
+    criado_de: Optional[datetime] = None
+    criado_ate: Optional[datetime] = None
+    data_de: Optional[date] = None  # data da nota fiscal
+    data_ate: Optional[date] = None
+    categorias: Optional[List[int]] = None
+    limite: Optional[int] = None  # NOTES_PAGE_SIZE se omitido
+
+class SignedUrlsSchema(BaseModel):
+    access_token: str
+    blob_names: List[str]
 
     class Config:
         from_attributes = True
@@ -110,5 +134,13 @@ class ReportSchema(BaseModel):
     access_token: str
     codigo_planilha: str
 
+    class Config:
+        from_attributes = True
+
+class ExportSheetSchema(BaseModel):
+    access_token: str
+    codigo_planilha: str
+    formato: str = "csv"  # csv ou xlsx
+
     class Config:
         from_attributes = True
\ No newline at end of file
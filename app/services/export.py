@@ -0,0 +1,197 @@
+"""
+Exportação das notas de uma planilha em CSV ou XLSX, gerada enquanto é enviada.
+
+As notas são lidas em blocos (blocos_de_notas) e cada bloco vira bytes assim
+que chega, então a memória não depende do tamanho da planilha e o cliente
+começa a receber o arquivo logo após a primeira consulta.
+"""
+import csv
+import io
+import re
+import zipfile
+from datetime import date, datetime
+from xml.sax.saxutils import escape
+
+from tortoise import timezone
+
+from app.core.metrics import Counter
+from app.services.report import blocos_de_notas, formatar_codigo
+
+COLUNAS = ["ID", "Data", "Código da Categoria", "Descrição da Categoria", "Descrição", "Valor", "Criada em", "Imagem"]
+CAMPOS = (
+    "id", "data", "codigo_categoria_id", "codigo_categoria__descricao", "descricao", "valor", "created_at",
+    "url_image_original",
+)
+
+exportacoes = Counter("sheet_exports_total", "Exportações de planilhas por formato.", ("formato",))
+
+def nome_exportacao(codigo_usuario, codigo_planilha, extensao):
+    data_atual = datetime.now().strftime('%d-%m-%Y')
+    return f"Notas-{formatar_codigo(codigo_usuario)}-{formatar_codigo(codigo_planilha)}-{data_atual}.{extensao}"
+
+# O Excel executa como fórmula uma célula de CSV que começa com um destes caracteres
+_INICIO_FORMULA = ("=", "+", "-", "@", "\t", "\r")
+
+def _texto_csv(valor):
+    """Texto livre (descrições, vindas do OCR) com apóstrofo na frente se parecer fórmula."""
+    if isinstance(valor, str) and valor.startswith(_INICIO_FORMULA):
+        return "'" + valor
+    return valor
+
+def _linha_csv(nota_id, data, codigo_categoria, categoria, descricao, valor, created_at, url):
+    return [nota_id, data.isoformat(), codigo_categoria, _texto_csv(categoria), _texto_csv(descricao),
+            f"{valor / 100:.2f}", created_at.isoformat(), _texto_csv(url)]
+
+async def exportar_csv(planilha_id):
+    """
+    CSV em UTF-8 com BOM (para o Excel reconhecer os acentos), valores em reais com ponto decimal.
+
+    Textos que começam com =, +, -, @ saem com um apóstrofo na frente para não
+    virarem fórmulas; no XLSX as strings são sempre texto e ficam intactas.
+    """
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+
+    def retirar() -> bytes:
+        dados = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return dados
+
+    buffer.write("\ufeff")
+    escritor.writerow(COLUNAS)
+    yield retirar()
+
+    async for bloco in blocos_de_notas(planilha_id, CAMPOS):
+        escritor.writerows(_linha_csv(*nota) for nota in bloco)
+        yield retirar()
+    exportacoes.inc(formato="csv")
+
+# Partes fixas do pacote XLSX: um workbook com uma planilha e os formatos de célula
+# 0 (padrão), 1 (data), 2 (número com duas casas) e 3 (data e hora)
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Notas" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>'
+)
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="2"><numFmt numFmtId="164" formatCode="dd/mm/yyyy"/><numFmt numFmtId="165" formatCode="dd/mm/yyyy hh:mm"/></numFmts>'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="4">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="2" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '</cellXfs>'
+    '</styleSheet>'
+)
+_INICIO_PLANILHA = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_FIM_PLANILHA = '</sheetData></worksheet>'
+
+_EPOCA_EXCEL = datetime(1899, 12, 30)
+# Caracteres de controle não são permitidos em XML (e podem vir do OCR nas descrições)
+_INVALIDOS_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+def _celula(valor, estilo=0):
+    if valor is None:
+        return '<c/>'
+    if isinstance(valor, str):
+        return f'<c t="inlineStr"><is><t>{escape(_INVALIDOS_XML.sub("", valor))}</t></is></c>'
+    if isinstance(valor, datetime):
+        if timezone.is_aware(valor):
+            valor = timezone.localtime(valor).replace(tzinfo=None)  # no fuso configurado do Tortoise
+        valor = (valor - _EPOCA_EXCEL).total_seconds() / 86400
+    elif isinstance(valor, date):
+        valor = (valor - _EPOCA_EXCEL.date()).days
+    return f'<c s="{estilo}"><v>{valor}</v></c>' if estilo else f'<c><v>{valor}</v></c>'
+
+def _linha_xlsx(celulas):
+    return '<row>' + ''.join(celulas) + '</row>'
+
+class _Saida(io.RawIOBase):
+    """Destino do zip que só acumula bytes; quem gera o arquivo os retira a cada bloco."""
+
+    def __init__(self):
+        self._partes = []
+
+    def writable(self):
+        return True
+
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        return len(dados)
+
+    def retirar(self) -> bytes:
+        dados, self._partes = b"".join(self._partes), []
+        return dados
+
+async def exportar_xlsx(planilha_id):
+    """
+    XLSX montado em fluxo: o zip é escrito num destino sem seek (com data
+    descriptors) e a planilha usa strings inline, sem tabela de strings
+    compartilhadas, então nada precisa ser mantido até o fim.
+    """
+    saida = _Saida()
+    with zipfile.ZipFile(saida, "w", compression=zipfile.ZIP_DEFLATED) as pacote:
+        pacote.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        pacote.writestr("_rels/.rels", _RELS)
+        pacote.writestr("xl/workbook.xml", _WORKBOOK)
+        pacote.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        pacote.writestr("xl/styles.xml", _STYLES)
+        yield saida.retirar()
+
+        with pacote.open("xl/worksheets/sheet1.xml", "w") as planilha:
+            planilha.write((_INICIO_PLANILHA + _linha_xlsx(_celula(coluna) for coluna in COLUNAS)).encode("utf-8"))
+            async for bloco in blocos_de_notas(planilha_id, CAMPOS):
+                linhas = "".join(
+                    _linha_xlsx((
+                        _celula(nota_id), _celula(data, 1), _celula(codigo_categoria), _celula(categoria),
+                        _celula(descricao), _celula(valor / 100, 2), _celula(created_at, 3), _celula(url),
+                    ))
+                    for nota_id, data, codigo_categoria, categoria, descricao, valor, created_at, url in bloco
+                )
+                planilha.write(linhas.encode("utf-8"))
+                yield saida.retirar()
+            planilha.write(_FIM_PLANILHA.encode("utf-8"))
+
+    yield saida.retirar()
+    exportacoes.inc(formato="xlsx")
+
+# formato -> (media type, gerador dos bytes a partir do id da planilha)
+FORMATOS = {
+    "csv": ("text/csv; charset=utf-8", exportar_csv),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", exportar_xlsx),
+}
@@ -0,0 +1,125 @@
+import re
+
+# Padrões compilados uma única vez no carregamento do módulo
+# Delimitado para não casar pedaços de números maiores (CNPJ, chave de acesso):
+# não pode continuar com um dígito, nem com separador seguido de dígito. Pontuação
+# depois do valor ("10,00." ou "R$10,00-") não impede o casamento
+VALOR_RE = re.compile(r"(?<![\d.,])\d{1,3}(?:[.,]\d{3})*[.,]\d{2}(?![.,]?\d)")
+DATA_RE = re.compile(r"\b(\d{2}/\d{2}/\d{4})\b|\b(\d{4})-(\d{2})-(\d{2})\b")
+
+# Todas as palavras-chave numa única alternância: cada linha é percorrida uma vez
+KEYWORDS = ["VALOR TOTAL", "VALOR A PAGAR", "VALOR PAGO"]
+KEYWORD_RE = re.compile(r"VALOR\s+(TOTAL|A\s+PAGAR|PAGO)", re.IGNORECASE)
+PRIORIDADE = {"TOTAL": 0, "A PAGAR": 1, "PAGO": 2}
+
+def clean_value(value):
+    # O último separador é o decimal; os demais são de milhar
+    posicao = max(value.rfind(","), value.rfind("."))
+    if posicao == -1:
+        return float(value)
+    inteiro = value[:posicao].replace(",", "").replace(".", "")
+    return float(f"{inteiro}.{value[posicao + 1:]}")
+
+def format_value(valor: float) -> str:
+    return f"{valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+def extract_date(text: str) -> str:
+    """Primeira data do texto, no formato DD/MM/YYYY esperado por /notes/confirm."""
+    match = DATA_RE.search(text)
+    if not match:
+        return ""
+    if match.group(1):
+        return match.group(1)
+    return f"{match.group(4)}/{match.group(3)}/{match.group(2)}"
+
+# Função para extrair o valor e a data do texto corrido (janela de ±50 caracteres)
+def extract_value_and_date(text):
+    valores = VALOR_RE.findall(text)
+
+    lower_text = text.lower()
+    valor_pago = 0.0
+
+    for keyword in KEYWORDS:
+        keyword_index = lower_text.find(keyword.lower())
+        if keyword_index != -1:
+            substring_around = text[max(0, keyword_index - 50):keyword_index + 50]
+            valores_proximos = VALOR_RE.findall(substring_around)
+            if valores_proximos:
+                valores_proximos_convertidos = [clean_value(v) for v in valores_proximos]
+                valor_pago = max(valores_proximos_convertidos)
+                break
+
+    if not valor_pago and valores:
+        valor_pago = max([clean_value(v) for v in valores])
+
+    return format_value(valor_pago), extract_date(text)
+
+def extract_lines(annotation: dict) -> list[str]:
+    """
+    Reconstrói as linhas visuais da nota a partir das caixas das palavras da Vision.
+
+    O `text` da Vision segue a ordem dos blocos, e em notas com rótulos e valores
+    em colunas separadas o rótulo fica longe do seu valor. Aqui as palavras são
+    agrupadas pela altura do centro da caixa e ordenadas da esquerda para a direita.
+    """
+    palavras = []
+    for page in annotation.get("pages", []):
+        for block in page.get("blocks", []):
+            for paragraph in block.get("paragraphs", []):
+                for word in paragraph.get("words", []):
+                    # Palavras da resposta enxuta já trazem o texto; as completas, só os símbolos
+                    texto = word.get("text") or "".join(symbol.get("text", "") for symbol in word.get("symbols", []))
+                    vertices = word.get("boundingBox", {}).get("vertices", [])
+                    if not texto or not vertices:
+                        continue
+                    xs = [v.get("x", 0) for v in vertices]
+                    ys = [v.get("y", 0) for v in vertices]
+                    palavras.append((min(xs), (min(ys) + max(ys)) / 2, max(1, max(ys) - min(ys)), texto))
+
+    palavras.sort(key=lambda p: p[1])
+
+    linhas = []  # [centro_y, altura, [(x, texto), ...]]
+    for x, centro_y, altura, texto in palavras:
+        if linhas and abs(centro_y - linhas[-1][0]) <= max(altura, linhas[-1][1]) / 2:
+            linha = linhas[-1]
+            quantidade = len(linha[2])
+            linha[0] = (linha[0] * quantidade + centro_y) / (quantidade + 1)
+            linha[1] = max(linha[1], altura)
+            linha[2].append((x, texto))
+        else:
+            linhas.append([centro_y, altura, [(x, texto)]])
+
+    return [" ".join(texto for _, texto in sorted(linha[2])) for linha in linhas]
+
+def extract_value_from_lines(linhas: list[str]):
+    """
+    Valor associado à palavra-chave de maior prioridade, buscado na mesma linha
+    (após a palavra-chave) ou, se a linha não tiver valor, na linha seguinte.
+    """
+    melhor = None
+    for i, linha in enumerate(linhas):
+        for match in KEYWORD_RE.finditer(linha):
+            prioridade = PRIORIDADE[" ".join(match.group(1).upper().split())]
+            if melhor is not None and melhor[0] <= prioridade:
+                continue
+
+            valor = VALOR_RE.search(linha, match.end())
+            if valor is None and i + 1 < len(linhas) and not KEYWORD_RE.search(linhas[i + 1]):
+                valor = VALOR_RE.search(linhas[i + 1])
+            if valor is not None:
+                melhor = (prioridade, clean_value(valor.group(0)))
+
+    return melhor[1] if melhor else None
+
+def extract_value_and_date_spatial(linhas, text):
+    """
+    Extrai valor e data usando as linhas reconstruídas pelas caixas das palavras.
+
+    Sem linhas (resultado antigo do cache) ou sem palavra-chave com valor,
+    recorre à extração pelo texto corrido.
+    """
+    valor = extract_value_from_lines(linhas) if linhas else None
+    if valor is None:
+        return extract_value_and_date(text)
+
+    return format_value(valor), extract_date(text)
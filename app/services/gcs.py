@@ -1,54 +1,91 @@
+import logging
 from google.cloud import storage
+from cachetools import TTLCache
+from google.auth.credentials import AnonymousCredentials
 from fastapi import UploadFile
+import threading
 import uuid
 import os
 from dotenv import load_dotenv
 from fastapi import HTTPException, status
 from datetime import datetime, timedelta
 
+from app.core.config import (
+    GCS_ENDPOINT, GCS_PROJECT, SIGNED_URL_EXPIRATION, SIGNED_URL_RENEW_BEFORE, SIGNED_URL_CACHE_SIZE
+)
+from app.core.metrics import Counter, Gauge, Histogram, cronometrar
+from app.services.workers import run_io
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+storage_duracao = Histogram("storage_operation_duration_seconds", "Duração das chamadas ao Cloud Storage.", ("operacao",))
+
 BUCKET_NAME = os.getenv('BUCKET_NAME')
 
-def upload_to_gcs(image: UploadFile):
+# Cliente e bucket compartilhados pelo processo: as credenciais são lidas uma
+# única vez e o bucket é referenciado sem a requisição de metadados do get_bucket
+_bucket = None
+_bucket_lock = threading.Lock()
+
+def get_bucket():
+    global _bucket
+
+    if _bucket is None:
+        with _bucket_lock:
+            if _bucket is None:
+                if GCS_ENDPOINT:
+                    client = storage.Client(
+                        project=GCS_PROJECT,
+                        credentials=AnonymousCredentials(),
+                        client_options={"api_endpoint": GCS_ENDPOINT},
+                    )
+                else:
+                    client = storage.Client()
+                _bucket = client.bucket(BUCKET_NAME)
+
+    return _bucket
+
+async def init_storage():
     try:
-        client = storage.Client()
+        await run_io(get_bucket)
     except Exception as e:
-        print(f"Erro ao autenticar no Google Cloud: {e}")
-        return None
+        logger.error("erro ao autenticar no Google Cloud", extra={"erro": str(e)})
 
+@cronometrar(storage_duracao, operacao="upload")
+def upload_to_gcs(image: UploadFile):
     try:
-        bucket = client.get_bucket(BUCKET_NAME)
+        bucket = get_bucket()
     except Exception as e:
-        print(f"Erro ao acessar o bucket: {e}")
+        logger.error("erro ao autenticar no Google Cloud", extra={"erro": str(e)})
         return None
 
     file_uuid = str(uuid.uuid4())
     blob = bucket.blob(f"{file_uuid}")
 
     try:
-        blob.upload_from_file(image.file, content_type=image.content_type)
+        # Com o tamanho conhecido, arquivos de até 8 MB vão num único upload multipart;
+        # sem ele a biblioteca sempre abre uma sessão retomável (uma ida e volta a mais)
+        blob.upload_from_file(image.file, size=image.size, content_type=image.content_type)
     except Exception as e:
-        print(f"Erro ao fazer o upload da imagem: {e}")
+        logger.error("erro ao fazer o upload da imagem", extra={"blob": file_uuid, "erro": str(e)})
         return None
 
     imagem_url = blob.public_url
 
     return imagem_url
 
-
+@cronometrar(storage_duracao, operacao="delete")
 def exclude_from_gcs(imagem_url: str):
-    client = storage.Client()
-    
     # Extrair o nome do arquivo da URL da imagem
     imagem_caminho = imagem_url.split("/")[-1]  # Pega a última parte da URL (nome do arquivo)
     
-    bucket = client.get_bucket(BUCKET_NAME)
-    blob = bucket.blob(imagem_caminho)
+    blob = get_bucket().blob(imagem_caminho)
     
     try:
         blob.delete()  # Exclui a imagem do GCS
-        print(f"Imagem {imagem_caminho} excluída com sucesso.")
+        logger.info("imagem excluída", extra={"blob": imagem_caminho})
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -56,18 +93,65 @@ def exclude_from_gcs(imagem_url: str):
         )
     
 
-def generate_signed_url(blob_name: str, expiration: int = 30) -> str:
+# Limite de operações por requisição da API de lote do Cloud Storage
+TAMANHO_LOTE_GCS = 100
+
+def _respostas_do_lote(batch) -> list:
+    """
+    Respostas de cada sub-requisição de um lote já enviado, na ordem das chamadas.
+
+    O Batch só guarda essas respostas no atributo privado `_responses`
+    (google-cloud-storage 2.19.0, preenchido por Batch.finish ao sair do `with`);
+    revisar este acesso ao atualizar a biblioteca.
+    """
+    return batch._responses
+
+@cronometrar(storage_duracao, operacao="delete_batch")
+def exclude_many_from_gcs(imagem_urls: list[str]) -> list[dict]:
+    """
+    Exclui várias imagens usando a API de lote do GCS (uma requisição a cada 100 imagens).
+
+    Uma falha não interrompe as demais: cada URL recebe o seu próprio status
+    ("excluida", "nao_encontrada" ou "erro").
+    """
+    bucket = get_bucket()
+    resultados = []
+
+    for inicio in range(0, len(imagem_urls), TAMANHO_LOTE_GCS):
+        lote = imagem_urls[inicio:inicio + TAMANHO_LOTE_GCS]
+        try:
+            with bucket.client.batch(raise_exception=False) as batch:
+                for imagem_url in lote:
+                    bucket.blob(imagem_url.split("/")[-1]).delete()
+            respostas = _respostas_do_lote(batch)
+        except Exception as e:
+            logger.error("erro ao excluir lote de imagens", extra={"imagens": len(lote), "erro": str(e)})
+            resultados.extend({"url": url, "status": "erro", "erro": str(e)} for url in lote)
+            continue
+
+        for imagem_url, resposta in zip(lote, respostas):
+            if 200 <= resposta.status_code < 300:
+                resultados.append({"url": imagem_url, "status": "excluida"})
+            elif resposta.status_code == 404:
+                resultados.append({"url": imagem_url, "status": "nao_encontrada"})
+            else:
+                resultados.append({"url": imagem_url, "status": "erro", "erro": f"HTTP {resposta.status_code}"})
+
+    return resultados
+
+@cronometrar(storage_duracao, operacao="sign")
+def generate_signed_url(blob_name: str, expiration: int = 30, method: str = "GET", content_type: str = None) -> str:
     """
     Gera uma URL assinada para um arquivo no Google Cloud Storage.
 
     :param blob_name: Nome do arquivo (blob) no bucket.
     :param expiration: Tempo de expiração da URL em minutos (padrão: 15 minutos).
+    :param method: Ação permitida (GET para leitura, PUT para envio direto ao bucket).
+    :param content_type: Content-Type que o cliente deve usar no PUT.
     :return: URL assinada.
     """
     try:
-        client = storage.Client()
-        bucket = client.get_bucket(BUCKET_NAME)
-        blob = bucket.blob(blob_name)
+        blob = get_bucket().blob(blob_name)
 
         # Define o tempo de expiração
         expiration_time = datetime.utcnow() + timedelta(minutes=expiration)
@@ -76,7 +160,8 @@ def generate_signed_url(blob_name: str, expiration: int = 30) -> str:
         signed_url = blob.generate_signed_url(
             version="v4",
             expiration=expiration_time,
-            method="GET",  # Ação permitida (GET para leitura)
+            method=method,
+            content_type=content_type,
         )
 
         return signed_url
@@ -84,4 +169,124 @@ def generate_signed_url(blob_name: str, expiration: int = 30) -> str:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erro ao gerar URL assinada: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+# URLs de leitura já assinadas; cada entrada sai do cache SIGNED_URL_RENEW_BEFORE
+# minutos antes de a URL expirar, e a próxima consulta assina uma nova
+_signed_urls = TTLCache(
+    maxsize=SIGNED_URL_CACHE_SIZE,
+    ttl=max(1, SIGNED_URL_EXPIRATION - SIGNED_URL_RENEW_BEFORE) * 60,
+)
+_signed_urls_lock = threading.Lock()
+_estatisticas_signed = {"hits": 0, "misses": 0}
+
+def get_signed_url(blob_name: str) -> str:
+    """URL assinada de leitura, reaproveitada do cache enquanto estiver longe de expirar."""
+    with _signed_urls_lock:
+        signed_url = _signed_urls.get(blob_name)
+        _estatisticas_signed["hits" if signed_url is not None else "misses"] += 1
+    if signed_url is None:
+        signed_url = generate_signed_url(blob_name, SIGNED_URL_EXPIRATION)
+        with _signed_urls_lock:
+            _signed_urls[blob_name] = signed_url
+    return signed_url
+
+def signed_url_cache_stats():
+    with _signed_urls_lock:
+        estatisticas = dict(_estatisticas_signed)
+    total = estatisticas["hits"] + estatisticas["misses"]
+    return {**estatisticas, "hit_ratio": estatisticas["hits"] / total if total else 0.0, "entradas": len(_signed_urls)}
+
+signed_url_consultas = Counter("signed_url_cache_lookups_total", "Consultas ao cache de URLs assinadas por resultado.",
+                               ("resultado",), funcao=lambda: {k: v for k, v in signed_url_cache_stats().items()
+                                                               if k in ("hits", "misses")})
+signed_url_hit_ratio = Gauge("signed_url_cache_hit_ratio", "Fração das URLs assinadas servidas do cache.",
+                             funcao=lambda: signed_url_cache_stats()["hit_ratio"])
+
+def get_signed_urls(blob_names: list[str]) -> dict:
+    """Assina vários blobs de uma vez; a assinatura é local, sem consultar o bucket."""
+    return {blob_name: get_signed_url(blob_name) for blob_name in dict.fromkeys(blob_names)}
+
+# Validade de uma sessão de upload retomável: definida pelo GCS (uma semana), não por nós
+DURACAO_SESSAO_RETOMAVEL = 7 * 24 * 60 * 60
+
+@cronometrar(storage_duracao, operacao="upload_url")
+def generate_upload_url(content_type: str, resumable: bool = False, expiration: int = 15) -> dict:
+    """
+    Reserva um blob novo e devolve onde o cliente deve enviar a imagem original.
+
+    Com `resumable`, abre uma sessão de upload retomável (o cliente envia com PUT
+    para a URL da sessão, podendo retomar após queda de conexão); caso contrário,
+    gera uma URL V4 assinada para um único PUT. `expires_in` é a validade, em
+    segundos, da URL devolvida: `expiration` minutos para a assinada e a duração
+    da sessão para a retomável.
+    """
+    blob_name = str(uuid.uuid4())
+
+    if resumable:
+        try:
+            upload_url = get_bucket().blob(blob_name).create_resumable_upload_session(content_type=content_type)
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Erro ao criar sessão de upload: {str(e)}"
+            )
+        expires_in = DURACAO_SESSAO_RETOMAVEL
+    else:
+        upload_url = generate_signed_url(blob_name, expiration, method="PUT", content_type=content_type)
+        expires_in = expiration * 60
+
+    return {
+        "blob_name": blob_name,
+        "upload_url": upload_url,
+        "url_image_original": public_url(blob_name),
+        "content_type": content_type,
+        "expires_in": expires_in,
+    }
+
+def public_url(blob_name: str) -> str:
+    return get_bucket().blob(blob_name).public_url
+
+@cronometrar(storage_duracao, operacao="download")
+def download_from_gcs(blob_name: str, end: int = None) -> bytes:
+    try:
+        return get_bucket().blob(blob_name).download_as_bytes(start=0 if end is not None else None, end=end)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Imagem {blob_name} não encontrada no bucket: {str(e)}"
+        )
+
+# Versões assíncronas: a chamada bloqueante ao GCS roda no pool de I/O
+async def upload_to_gcs_async(image: UploadFile):
+    """
+    Como upload_to_gcs, mas uma falha vira exceção em vez de None.
+
+    Quem envia em paralelo com asyncio.gather precisa ver a falha como erro
+    para desfazer os outros envios e não responder 200 com a URL nula.
+    """
+    imagem_url = await run_io(upload_to_gcs, image)
+    if imagem_url is None:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail="Erro ao enviar a imagem para o armazenamento."
+        )
+    return imagem_url
+
+async def exclude_from_gcs_async(imagem_url: str):
+    return await run_io(exclude_from_gcs, imagem_url)
+
+async def exclude_many_from_gcs_async(imagem_urls: list[str]) -> list[dict]:
+    return await run_io(exclude_many_from_gcs, imagem_urls)
+
+async def get_signed_url_async(blob_name: str) -> str:
+    return await run_io(get_signed_url, blob_name)
+
+async def get_signed_urls_async(blob_names: list[str]) -> dict:
+    return await run_io(get_signed_urls, blob_names)
+
+async def generate_upload_url_async(content_type: str, resumable: bool = False) -> dict:
+    return await run_io(generate_upload_url, content_type, resumable)
+
+async def download_from_gcs_async(blob_name: str, end: int = None) -> bytes:
+    return await run_io(download_from_gcs, blob_name, end)
@@ -0,0 +1,108 @@
+import logging
+import cv2
+import numpy as np
+
+from app.core.config import SKEW_TOLERANCE_DEGREES
+
+logger = logging.getLogger(__name__)
+
+def vertices_array(vertices) -> np.ndarray:
+    """Converte a lista de vértices (x, y) da Vision num array (N, 2) de float32."""
+    return np.asarray(vertices, dtype=np.float32).reshape(-1, 2)
+
+def block_angles(pontos: np.ndarray) -> np.ndarray:
+    """
+    Inclinação, em graus, de cada bloco de texto (quatro vértices por bloco).
+
+    Usa a direção média das bordas superior e inferior de cada quadrilátero,
+    reduzida ao intervalo [-45, 45): blocos girados em 90° contam como retos.
+    """
+    blocos = pontos[:len(pontos) // 4 * 4].reshape(-1, 4, 2)
+    direcao = (blocos[:, 1] - blocos[:, 0]) + (blocos[:, 2] - blocos[:, 3])
+    angulos = np.degrees(np.arctan2(direcao[:, 1], direcao[:, 0]))
+    return (angulos + 45) % 90 - 45
+
+def skew_angle(pontos: np.ndarray, tolerancia: float) -> float | None:
+    """
+    Inclinação da nota: a mediana das inclinações dos blocos.
+
+    Devolve None quando os blocos não concordam entre si (desvio mediano acima
+    da tolerância). O retângulo mínimo sobre todos os cantos não serve para isso:
+    em layouts esparsos (cabeçalho à esquerda, total embaixo à direita) ele sai
+    na diagonal mesmo com a nota reta.
+    """
+    angulos = block_angles(pontos)
+    if len(angulos) == 0:
+        return None
+
+    mediana = float(np.median(angulos))
+    if np.median(np.abs(angulos - mediana)) > tolerancia:
+        return None
+    return mediana
+
+def rotated_rect(pontos: np.ndarray, angulo: float):
+    """Menor retângulo com a inclinação dada que contém os pontos, no formato do cv2.minAreaRect."""
+    theta = np.radians(angulo)
+    eixo_u = np.float32([np.cos(theta), np.sin(theta)])
+    eixo_v = np.float32([-np.sin(theta), np.cos(theta)])
+    proj_u, proj_v = pontos @ eixo_u, pontos @ eixo_v
+
+    centro = eixo_u * (proj_u.min() + proj_u.max()) / 2 + eixo_v * (proj_v.min() + proj_v.max()) / 2
+    tamanho = (float(proj_u.max() - proj_u.min()), float(proj_v.max() - proj_v.min()))
+    return (float(centro[0]), float(centro[1])), tamanho, angulo
+
+def crop_axis_aligned(img, pontos: np.ndarray):
+    """Recorte pela caixa alinhada aos eixos, limitado à imagem; devolve uma view, sem cópia."""
+    altura, largura = img.shape[:2]
+    min_x, min_y = np.floor(pontos.min(axis=0)).astype(int)
+    max_x, max_y = np.ceil(pontos.max(axis=0)).astype(int)
+
+    min_x, max_x = np.clip([min_x, max_x], 0, largura)
+    min_y, max_y = np.clip([min_y, max_y], 0, altura)
+
+    if max_x - min_x < 1 or max_y - min_y < 1:
+        return img
+    return img[min_y:max_y, min_x:max_x]
+
+def order_corners(box: np.ndarray) -> np.ndarray:
+    """Ordena quatro cantos como superior esquerdo, superior direito, inferior direito, inferior esquerdo."""
+    soma = box.sum(axis=1)
+    diferenca = box[:, 1] - box[:, 0]
+    return np.float32([box[np.argmin(soma)], box[np.argmin(diferenca)],
+                       box[np.argmax(soma)], box[np.argmax(diferenca)]])
+
+def warp_rotated(img, rect):
+    """Endireita a região do retângulo mínimo inclinado com uma transformação de perspectiva."""
+    altura, largura = img.shape[:2]
+    box = cv2.boxPoints(rect)
+    box[:, 0] = np.clip(box[:, 0], 0, largura - 1)
+    box[:, 1] = np.clip(box[:, 1], 0, altura - 1)
+    origem = order_corners(box)
+
+    largura_destino = int(round(max(np.linalg.norm(origem[1] - origem[0]), np.linalg.norm(origem[2] - origem[3]))))
+    altura_destino = int(round(max(np.linalg.norm(origem[3] - origem[0]), np.linalg.norm(origem[2] - origem[1]))))
+    if largura_destino < 1 or altura_destino < 1:
+        return img
+
+    destino = np.float32([[0, 0], [largura_destino, 0], [largura_destino, altura_destino], [0, altura_destino]])
+    matrix = cv2.getPerspectiveTransform(origem, destino)
+    return cv2.warpPerspective(img, matrix, (largura_destino, altura_destino), borderMode=cv2.BORDER_REPLICATE)
+
+def correct_perspective(img, vertices, tolerancia: float = SKEW_TOLERANCE_DEGREES):
+    """
+    Recorta a nota a partir dos vértices dos blocos de texto da Vision.
+
+    A inclinação vem das bordas de cada bloco. Se ela está dentro da tolerância,
+    ou se os blocos discordam entre si, o recorte é só uma fatia do array. A
+    transformação de perspectiva fica reservada para notas realmente inclinadas.
+    """
+    pontos = vertices_array(vertices)
+    if len(pontos) < 4:
+        logger.info("número insuficiente de vértices para correção")
+        return img
+
+    angulo = skew_angle(pontos, tolerancia)
+    if angulo is None or abs(angulo) <= tolerancia:
+        return crop_axis_aligned(img, pontos)
+
+    return warp_rotated(img, rotated_rect(pontos, angulo))
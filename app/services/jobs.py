@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import secrets
+import time
+import uuid
+from fastapi import HTTPException, status
+
+from app.core.config import JOB_WORKERS, JOB_QUEUE_SIZE, JOB_TTL, JOB_STREAM_TOKEN_TTL, SCAN_RETRY_AFTER
+from app.core.logs import correlation_id
+from app.core.metrics import Gauge
+
+logger = logging.getLogger(__name__)
+
+PENDENTE = "pendente"
+PROCESSANDO = "processando"
+CONCLUIDO = "concluido"
+ERRO = "erro"
+
+class Job:
+    """Estado de uma digitalização em segundo plano, mantido em memória neste worker."""
+
+    def __init__(self, codigo_usuario: str, tarefa):
+        self.id = uuid.uuid4().hex
+        self.codigo_usuario = codigo_usuario
+        self.status = PENDENTE
+        self.etapa = None
+        self.resultado = None
+        self.erro = None
+        self.criado_em = self.atualizado_em = time.time()
+        self.correlation_id = correlation_id.get()
+        # Credencial só deste job para o stream SSE, que vai na URL (o EventSource
+        # não envia cabeçalhos); assim o token do usuário não aparece em logs
+        self.token_stream = secrets.token_urlsafe(32)
+        # Incrementada a cada atualização: quem acompanha compara com a última que enviou
+        self.versao = 0
+        self._tarefa = tarefa
+        self._mudou = asyncio.Event()
+
+    @property
+    def finalizado(self) -> bool:
+        return self.status in (CONCLUIDO, ERRO)
+
+    def atualizar(self, **campos):
+        for campo, valor in campos.items():
+            setattr(self, campo, valor)
+        self.atualizado_em = time.time()
+        self.versao += 1
+
+        # Acorda quem está acompanhando o job e prepara o próximo evento
+        self._mudou.set()
+        self._mudou = asyncio.Event()
+
+    async def aguardar_mudanca(self, versao: int, timeout: float) -> bool:
+        """
+        Espera o job passar da `versao` informada; devolve False no timeout.
+
+        Se ele já mudou (por exemplo, enquanto o evento anterior era enviado),
+        devolve na hora, sem esperar pelo próximo Event.
+        """
+        if self.versao != versao:
+            return True
+        try:
+            await asyncio.wait_for(self._mudou.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "etapa": self.etapa,
+            "resultado": self.resultado,
+            "erro": self.erro,
+        }
+
+_jobs: dict[str, Job] = {}
+_fila: asyncio.Queue | None = None
+_workers: list[asyncio.Task] = []
+
+def _remover_expirados():
+    limite = time.time() - JOB_TTL
+    for job_id in [j.id for j in _jobs.values() if j.finalizado and j.atualizado_em < limite]:
+        del _jobs[job_id]
+
+def submit_job(codigo_usuario: str, tarefa) -> Job:
+    """
+    Enfileira uma digitalização para os workers em segundo plano.
+
+    `tarefa` é uma corrotina que recebe o job e devolve o resultado final; ela pode
+    chamar `job.atualizar(etapa=...)` para informar o progresso.
+    """
+    _remover_expirados()
+
+    job = Job(codigo_usuario, tarefa)
+    try:
+        _fila.put_nowait(job)
+    except asyncio.QueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Fila de processamento cheia. Tente novamente em instantes.",
+            headers={"Retry-After": str(SCAN_RETRY_AFTER)},
+        )
+
+    _jobs[job.id] = job
+    return job
+
+def get_job(job_id: str, codigo_usuario: str) -> Job:
+    job = _jobs.get(job_id)
+    if not job or job.codigo_usuario != codigo_usuario:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job não encontrado.")
+    return job
+
+def get_job_por_token(job_id: str, token: str) -> Job:
+    """Job do stream SSE, autorizado pelo token do próprio job enquanto ele não expira."""
+    job = _jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job não encontrado.")
+    if not secrets.compare_digest(token, job.token_stream) or time.time() - job.criado_em > JOB_STREAM_TOKEN_TTL:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token do job inválido ou expirado.")
+    return job
+
+def jobs_em_andamento() -> int:
+    return sum(1 for job in _jobs.values() if not job.finalizado)
+
+jobs_ativos = Gauge("jobs_in_flight", "Jobs pendentes ou em processamento neste worker.", funcao=jobs_em_andamento)
+jobs_na_fila = Gauge("jobs_queued", "Jobs aguardando um worker livre.", funcao=lambda: _fila.qsize() if _fila else 0)
+
+async def _worker():
+    while True:
+        job = await _fila.get()
+        # Os logs do job seguem com o id da requisição que o criou
+        correlation_id.set(job.correlation_id)
+        job.atualizar(status=PROCESSANDO)
+        try:
+            resultado = await job._tarefa(job)
+            job.atualizar(status=CONCLUIDO, etapa=None, resultado=resultado)
+        except HTTPException as e:
+            job.atualizar(status=ERRO, erro=e.detail)
+        except Exception as e:
+            logger.exception("erro no job", extra={"job_id": job.id})
+            job.atualizar(status=ERRO, erro=str(e))
+        finally:
+            job._tarefa = None
+            _fila.task_done()
+
+def start_job_workers():
+    global _fila
+    _fila = asyncio.Queue(maxsize=JOB_QUEUE_SIZE)
+    for _ in range(JOB_WORKERS):
+        _workers.append(asyncio.create_task(_worker()))
+
+async def stop_job_workers():
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
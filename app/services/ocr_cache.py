@@ -0,0 +1,114 @@
+import logging
+import time
+from cachetools import TTLCache
+from datetime import datetime, timedelta, timezone
+
+from app.core.config import OCR_CACHE_MAX_BYTES, OCR_CACHE_TTL, OCR_CACHE_DB_TTL_DAYS
+from app.core.metrics import Counter, Gauge
+from app.models import ResultadoOcr
+
+logger = logging.getLogger(__name__)
+
+def _tamanho(resultado):
+    vertices, texto, linhas = resultado
+    # O texto e as linhas têm praticamente o mesmo conteúdo
+    return 2 * len(texto.encode('utf-8')) + 16 * len(vertices)
+
+# Primeiro nível: LRU em memória, limitado em bytes e com expiração
+_memoria = TTLCache(maxsize=OCR_CACHE_MAX_BYTES, ttl=OCR_CACHE_TTL, getsizeof=_tamanho)
+
+_estatisticas = {"hits_memoria": 0, "hits_banco": 0, "misses": 0}
+
+# Intervalo mínimo, em segundos, entre duas limpezas da tabela neste worker
+INTERVALO_LIMPEZA = 3600
+_ultima_limpeza = 0.0
+
+def _limite_validade() -> datetime:
+    return datetime.now(timezone.utc) - timedelta(days=OCR_CACHE_DB_TTL_DAYS)
+
+async def get_ocr_result(sha256: str):
+    """
+    Busca o resultado de OCR de uma imagem já processada.
+
+    :return: tupla (vertices, texto, linhas) ou None se a imagem nunca foi enviada à Vision.
+    """
+    resultado = _memoria.get(sha256)
+    if resultado is not None:
+        _estatisticas["hits_memoria"] += 1
+        return resultado
+
+    # Segundo nível: tabela persistente, compartilhada entre workers
+    try:
+        registro = await ResultadoOcr.filter(sha256=sha256, updated_at__gte=_limite_validade()).first()
+    except Exception as e:
+        # Falha no cache persistente não deve derrubar a digitalização: segue para a Vision
+        logger.warning("erro ao consultar resultado de OCR no cache", extra={"erro": str(e)})
+        registro = None
+
+    if registro is None:
+        _estatisticas["misses"] += 1
+        return None
+
+    _estatisticas["hits_banco"] += 1
+    resultado = ([tuple(v) for v in registro.vertices], registro.texto, registro.linhas)
+    _guardar_em_memoria(sha256, resultado)
+    return resultado
+
+async def save_ocr_result(sha256: str, vertices, texto: str, linhas=None):
+    resultado = (list(vertices), texto, linhas)
+    _guardar_em_memoria(sha256, resultado)
+    try:
+        await ResultadoOcr.update_or_create(
+            sha256=sha256,
+            defaults={"vertices": [list(v) for v in vertices], "texto": texto, "linhas": linhas},
+        )
+    except Exception as e:
+        # Falha no cache persistente não deve derrubar a digitalização
+        logger.warning("erro ao salvar resultado de OCR no cache", extra={"erro": str(e)})
+    await _remover_expirados()
+
+async def _remover_expirados():
+    """
+    Apaga da tabela os resultados que já passaram de OCR_CACHE_DB_TTL_DAYS.
+
+    A leitura já os ignora; sem esta limpeza a tabela só cresceria. Roda no
+    máximo uma vez por INTERVALO_LIMPEZA em cada worker, aproveitando um save.
+    """
+    global _ultima_limpeza
+
+    agora = time.monotonic()
+    if _ultima_limpeza and agora - _ultima_limpeza < INTERVALO_LIMPEZA:
+        return
+    _ultima_limpeza = agora
+
+    try:
+        removidos = await ResultadoOcr.filter(updated_at__lt=_limite_validade()).delete()
+    except Exception as e:
+        logger.warning("erro ao limpar o cache de OCR", extra={"erro": str(e)})
+        return
+    if removidos:
+        logger.info("resultados de OCR expirados removidos", extra={"removidos": removidos})
+
+def _guardar_em_memoria(sha256, resultado):
+    try:
+        _memoria[sha256] = resultado
+    except ValueError:
+        # Resultado maior que o próprio cache: fica só no banco
+        pass
+
+def cache_stats():
+    hits = _estatisticas["hits_memoria"] + _estatisticas["hits_banco"]
+    total = hits + _estatisticas["misses"]
+    return {
+        **_estatisticas,
+        "hit_ratio": hits / total if total else 0.0,
+        "entradas_memoria": len(_memoria),
+        "bytes_memoria": _memoria.currsize,
+    }
+
+ocr_cache_consultas = Counter("ocr_cache_lookups_total", "Consultas ao cache de OCR por resultado.", ("resultado",),
+                              funcao=lambda: dict(_estatisticas))
+ocr_cache_hit_ratio = Gauge("ocr_cache_hit_ratio", "Fração das consultas ao cache de OCR atendidas sem a Vision.",
+                            funcao=lambda: cache_stats()["hit_ratio"])
+ocr_cache_bytes = Gauge("ocr_cache_memory_bytes", "Tamanho estimado do cache de OCR em memória.",
+                        funcao=lambda: _memoria.currsize)
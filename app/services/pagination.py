@@ -0,0 +1,87 @@
+"""
+Paginação por chave (created_at, id) das listas de notas.
+
+Cada página é uma consulta `WHERE (created_at, id) < cursor ORDER BY created_at
+DESC, id DESC LIMIT n`, atendida pelos índices de Nota, então o custo não
+depende do tamanho da planilha nem de quantas páginas já foram lidas. O cursor
+entregue ao cliente é opaco: a posição da última nota em base64.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime, timezone
+
+from fastapi import HTTPException, status
+from tortoise import timezone as tortoise_timezone
+from tortoise.expressions import Q
+
+from app.core.config import NOTES_PAGE_MAX
+
+# Colunas de Nota que podem ser pedidas em `campos` (o padrão são todas)
+CAMPOS_NOTA = (
+    "id", "codigo_usuario_id", "planilha_id", "codigo_categoria_id", "data", "valor", "descricao",
+    "url_image_original", "url_image_scan", "url_image_thumb", "url_image_medium", "created_at",
+)
+
+def em_utc(momento: datetime) -> datetime:
+    """
+    Normaliza um instante para UTC antes de filtrar por ele.
+
+    Sem fuso, vale o fuso configurado no Tortoise. No SQLite as datas são
+    comparadas como texto, então o valor precisa estar no fuso em que foi gravado.
+    """
+    if not tortoise_timezone.is_aware(momento):
+        momento = tortoise_timezone.make_aware(momento)
+    return momento.astimezone(timezone.utc)
+
+def depois_de(created_at: datetime, nota_id: int) -> Q:
+    """Notas que vêm depois de (created_at, id) na ordem mais recentes primeiro."""
+    created_at = em_utc(created_at)
+    return Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=nota_id)
+
+def codificar_cursor(created_at: datetime, nota_id: int) -> str:
+    posicao = json.dumps([em_utc(created_at).isoformat(), nota_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(posicao.encode()).decode().rstrip("=")
+
+def decodificar_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        created_at, nota_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(created_at), int(nota_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor inválido.")
+
+def validar_campos(campos: list[str] | None) -> tuple:
+    """Colunas a buscar; id e created_at entram sempre (formam o cursor)."""
+    if not campos:
+        return CAMPOS_NOTA
+
+    invalidos = [campo for campo in campos if campo not in CAMPOS_NOTA]
+    if invalidos:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Campos inválidos: {', '.join(invalidos)}. Opções válidas: {', '.join(CAMPOS_NOTA)}."
+        )
+    return tuple(dict.fromkeys(["id", *campos, "created_at"]))
+
+async def pagina_de_notas(consulta, limite: int, cursor: str | None = None, campos: list[str] | None = None):
+    """
+    Uma página da consulta de notas, das mais recentes para as mais antigas.
+
+    As notas vêm como dicts só com as colunas pedidas. Busca uma nota a mais
+    para saber se existe próxima página sem precisar de um COUNT.
+
+    :return: tupla (notas, next_cursor), com next_cursor None na última página.
+    """
+    if limite < 1:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="O limite deve ser maior que zero.")
+    limite = min(limite, NOTES_PAGE_MAX)
+
+    if cursor:
+        consulta = consulta.filter(depois_de(*decodificar_cursor(cursor)))
+
+    notas = await consulta.order_by("-created_at", "-id").limit(limite + 1).values(*validar_campos(campos))
+    if len(notas) <= limite:
+        return notas, None
+
+    notas = notas[:limite]
+    return notas, codificar_cursor(notas[-1]["created_at"], notas[-1]["id"])
@@ -1,20 +1,90 @@
+import asyncio
+import io
+import logging
 from tortoise import Tortoise
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
+from tortoise.functions import Count, Max, Min, Sum
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.platypus import Table, TableStyle, Paragraph, Spacer, Image
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import LETTER
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch, mm
-from app.models import Nota, Categoria, Planilha, Usuario
+from app.core.config import REPORT_CHUNK_SIZE
+from app.models import Nota, Categoria, Planilha
+from app.services.workers import run_report
+from app.services.pagination import depois_de
+from app.services.report_cache import versao_relatorio, get_relatorio, save_relatorio
 
 from fastapi import APIRouter, HTTPException, status
-from tortoise.exceptions import DoesNotExist
 
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
+# Estilos criados uma única vez, no carregamento do módulo
+estilos = getSampleStyleSheet()
+
+# Estilo customizado para textos menores e em negrito (ajustando o tamanho da fonte)
+estilo_negrito_menor = ParagraphStyle(
+    'NegritoMenor',
+    parent=estilos['Normal'],
+    fontName='Helvetica-Bold',  # Definindo o estilo como negrito
+    fontSize=9,  # Ajustando o tamanho da fonte para 9
+    spaceAfter=4  # Adiciona um pequeno espaço depois do texto
+)
+
+estilo_tabela_info = TableStyle([
+    ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ('GRID', (0, 0), (-1, -1), 0, colors.white)
+])
+
+estilo_tabela_notas = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#4CAF50")),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.gray)
+])
+
+estilo_tabela_resumo = TableStyle([
+    ('BACKGROUND', (-1, -1), (-1, -1), colors.HexColor("#4CAF50")),
+    ('TEXTCOLOR', (-1, -1), (-1, -1), colors.white),
+    ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+])
+
+CABECALHO_NOTAS = ["ID", "Descrição da Categoria", "Valor", "Data"]
+LARGURAS_NOTAS = [1 * inch, 2.5 * inch, 1 * inch, 1 * inch]
+
+# Margens da página mais o recuo de 6pt que o SimpleDocTemplate aplicava no frame
+MARGEM = 40
+RECUO_FRAME = 6
+
+def _medir_tabela_notas():
+    """Altura do cabeçalho e de cada linha da tabela de notas (as células têm uma linha só)."""
+    def altura(linhas):
+        tabela = Table([CABECALHO_NOTAS] + [["0", "x", "x", "x"]] * linhas, colWidths=LARGURAS_NOTAS, style=estilo_tabela_notas)
+        return tabela.wrap(LETTER[0], LETTER[1])[1]
+    linha = altura(2) - altura(1)
+    return altura(1) - linha, linha
+
+ALTURA_CABECALHO_NOTAS, ALTURA_LINHA_NOTA = _medir_tabela_notas()
+
 def formatar_codigo(codigo):
     """Remove ou substitui caracteres inválidos no nome do arquivo."""
     return codigo.replace('/', '_')  # Substitui a barra por um underscore
 
+def formatar_valor(centavos):
+    return f"R$ {centavos / 100:,.2f}".replace('.', ',')
+
 def footer(canvas, doc):
     """Adiciona o número da página no canto inferior direito."""
     canvas.saveState()
@@ -22,135 +92,255 @@ def footer(canvas, doc):
     canvas.drawRightString(200 * mm, 10 * mm, page_number_text)
     canvas.restoreState()
 
-async def criar_pdf_nota_fiscal(codigo_usuario, codigo_planilha):
-    # Configuração do PDF com margem adicional
+def nome_relatorio(codigo_usuario, codigo_planilha):
     data_atual = datetime.now().strftime('%d-%m-%Y')
-    nome_arquivo = f"Relatorio-{formatar_codigo(codigo_usuario)}-{formatar_codigo(codigo_planilha)}-{data_atual}.pdf"
-    doc = SimpleDocTemplate(
-        nome_arquivo,
-        pagesize=LETTER,
-        rightMargin=40,  # Aumentando a margem direita
-        leftMargin=40,  # Aumentando a margem esquerda
-        topMargin=40,   # Aumentando a margem superior
-        bottomMargin=40 # Aumentando a margem inferior
-    )
-    elementos = []
-    estilos = getSampleStyleSheet()
-
-    # Estilo customizado para textos menores e em negrito (ajustando o tamanho da fonte)
-    estilo_negrito_menor = ParagraphStyle(
-        'NegritoMenor',
-        parent=estilos['Normal'],
-        fontName='Helvetica-Bold',  # Definindo o estilo como negrito
-        fontSize=9,  # Ajustando o tamanho da fonte para 9
-        spaceAfter=4  # Adiciona um pequeno espaço depois do texto
-    )
+    return f"Relatorio-{formatar_codigo(codigo_usuario)}-{formatar_codigo(codigo_planilha)}-{data_atual}.pdf"
+
+class RelatorioPDF:
+    """
+    Monta o PDF página a página, sem manter a lista de elementos do documento.
+
+    Os elementos são desenhados assim que chegam e descartados em seguida. As
+    linhas de notas ficam num buffer e saem em uma tabela por página, do tamanho
+    exato do espaço livre e com o cabeçalho repetido, sem o reportlab precisar
+    dividir uma tabela gigante.
+    """
+
+    def __init__(self, buffer):
+        self.canvas = Canvas(buffer, pagesize=LETTER)
+        self.page = 1
+        self.x = MARGEM + RECUO_FRAME
+        self.largura = LETTER[0] - 2 * (MARGEM + RECUO_FRAME)
+        self.base = MARGEM + RECUO_FRAME
+        self.y = LETTER[1] - MARGEM - RECUO_FRAME
+        self._linhas = []
+
+    def _nova_pagina(self):
+        footer(self.canvas, self)
+        self.canvas.showPage()
+        self.page += 1
+        self.y = LETTER[1] - MARGEM - RECUO_FRAME
+
+    def adicionar(self, *elementos):
+        """Desenha elementos que não se dividem (textos, espaços, tabelas pequenas)."""
+        self._descarregar_linhas(final=True)
+        for elemento in elementos:
+            topo_da_pagina = self.y == LETTER[1] - MARGEM - RECUO_FRAME
+            if isinstance(elemento, Spacer) and topo_da_pagina:
+                continue  # como no frame do platypus, espaços no topo da página são ignorados
+
+            largura, altura = elemento.wrapOn(self.canvas, self.largura, self.y - self.base)
+            altura += elemento.getSpaceBefore() + elemento.getSpaceAfter()
+            if altura > self.y - self.base and not topo_da_pagina:
+                self._nova_pagina()
+
+            self.y -= elemento.getSpaceBefore()
+            elemento.drawOn(self.canvas, self.x, self.y - (altura - elemento.getSpaceBefore() - elemento.getSpaceAfter()),
+                            _sW=self.largura - largura)
+            self.y -= altura - elemento.getSpaceBefore()
+
+    def adicionar_notas(self, linhas):
+        self._linhas.extend(linhas)
+        self._descarregar_linhas()
+
+    def _capacidade(self) -> int:
+        return int((self.y - self.base - ALTURA_CABECALHO_NOTAS) // ALTURA_LINHA_NOTA)
+
+    def _descarregar_linhas(self, final: bool = False):
+        while self._linhas and (final or len(self._linhas) >= self._capacidade()):
+            capacidade = self._capacidade()
+            if capacidade < 1:
+                self._nova_pagina()
+                continue
+
+            pagina, self._linhas = self._linhas[:capacidade], self._linhas[capacidade:]
+            tabela = Table([CABECALHO_NOTAS] + pagina, colWidths=LARGURAS_NOTAS, style=estilo_tabela_notas)
+            largura, altura = tabela.wrapOn(self.canvas, self.largura, self.y - self.base)
+            tabela.drawOn(self.canvas, self.x, self.y - altura, _sW=self.largura - largura)
+            self.y -= altura
+
+            if len(pagina) == capacidade:
+                self._nova_pagina()
+
+    def finalizar(self):
+        self._descarregar_linhas(final=True)
+        footer(self.canvas, self)
+        self.canvas.save()
+
+def renderizar_pdf(cabecalho, proximo_bloco) -> bytes:
+    """
+    Monta o PDF em memória e devolve os bytes.
+
+    :param cabecalho: agregados da planilha, de carregar_cabecalho_relatorio.
+    :param proximo_bloco: função que devolve o próximo bloco de notas, como tuplas
+        (id, descrição da categoria, valor em centavos, data), ou None ao terminar.
+    """
+    buffer = io.BytesIO()
+    relatorio = RelatorioPDF(buffer)
 
     # 1. Cabeçalho
     # logo_path = "logo.png"  # Caminho para o logotipo
     # try:
     #     logo = Image(logo_path, width=1.0 * inch, height=0.7 * inch)  # Logo menor
     #     logo.hAlign = 'LEFT'
-    #     elementos.append(logo)
+    #     relatorio.adicionar(logo)
     # except FileNotFoundError:
-    #     elementos.append(Paragraph("[Logotipo da Empresa]", estilos['Normal']))
-        
-    # elementos.append(Spacer(1, 0.1 * inch))  # Espaço após a tabela
+    #     relatorio.adicionar(Paragraph("[Logotipo da Empresa]", estilos['Normal']))
 
     # 2. Cidade e Período
     cidade_text = Paragraph("Cidade: São Paulo", estilo_negrito_menor)
-    periodo_text = Paragraph("Período: 01/01/2025 - 10/01/2025", estilo_negrito_menor)
-    tabela_cidade_periodo = Table([[cidade_text, periodo_text]], colWidths=[3 * inch, 2.5 * inch])
-    tabela_cidade_periodo.setStyle(TableStyle([
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('GRID', (0, 0), (-1, -1), 0, colors.white)
-    ]))
-    elementos.append(tabela_cidade_periodo)
-    elementos.append(Spacer(1, 0.1 * inch))  # Espaço após a tabela
+    periodo = "-"
+    if cabecalho["inicio"] is not None:
+        periodo = f"{cabecalho['inicio'].strftime('%d/%m/%Y')} - {cabecalho['fim'].strftime('%d/%m/%Y')}"
+    periodo_text = Paragraph(f"Período: {periodo}", estilo_negrito_menor)
+    tabela_cidade_periodo = Table([[cidade_text, periodo_text]], colWidths=[3 * inch, 2.5 * inch], style=estilo_tabela_info)
+    relatorio.adicionar(tabela_cidade_periodo, Spacer(1, 0.1 * inch))
 
     # 3. Quantidade de Notas Cadastradas e Código da Planilha
-    qtd_notas = await Nota.filter(codigo_usuario=codigo_usuario).count()
-    qtd_notas_text = Paragraph(f"Notas Cadastradas: {qtd_notas}", estilo_negrito_menor)
-    ultima_planilha = await Planilha.filter(codigo_usuario=codigo_usuario).order_by('-id').first()
-    codigo_planilha_text = Paragraph(f"Código da Planilha: {ultima_planilha}", estilo_negrito_menor)
-    tabela_qtd_notas = Table([[qtd_notas_text, codigo_planilha_text]], colWidths=[3 * inch, 2.5 * inch])
-    tabela_qtd_notas.setStyle(TableStyle([
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('GRID', (0, 0), (-1, -1), 0, colors.white)
-    ]))
-    elementos.append(tabela_qtd_notas)
-    elementos.append(Spacer(1, 0.3 * inch))  # Espaço após a tabela
-
-    # 4. Tabela de Notas Fiscais
-    user = await Usuario.filter(codigo_usuario=codigo_usuario).exists()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuário não encontrado.")
+    qtd_notas_text = Paragraph(f"Notas Cadastradas: {cabecalho['qtd_notas']}", estilo_negrito_menor)
+    codigo_planilha_text = Paragraph(f"Código da Planilha: {cabecalho['codigo_planilha']}", estilo_negrito_menor)
+    tabela_qtd_notas = Table([[qtd_notas_text, codigo_planilha_text]], colWidths=[3 * inch, 2.5 * inch], style=estilo_tabela_info)
+    relatorio.adicionar(tabela_qtd_notas, Spacer(1, 0.3 * inch))
 
-    try:
-        sheet = await Planilha.get(codigo_planilha=codigo_planilha, codigo_usuario=codigo_usuario)
-    except DoesNotExist:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Planilha não encontrada para este usuário.")
-
-    # Buscando as notas fiscais
-    notas = await Nota.filter(codigo_usuario=codigo_usuario, planilha_id=sheet.id).select_related('codigo_categoria').order_by("-created_at")
-
-    # Preparando a lista de notas fiscais
-    notas_fiscais = []
-    notas_fiscais.append(["ID", "Descrição da Categoria", "Valor", "Data"])
-
-    # Iterando sobre as notas
-    for nota in notas:
-        categoria = nota.codigo_categoria  # A categoria já está carregada
-        valor_formatado = f"R$ {nota.valor / 100:,.2f}".replace('.', ',')
-        notas_fiscais.append([nota.id, categoria.descricao, valor_formatado, nota.data.strftime('%d/%m/%Y')])
-    
-    tabela_nota_fiscal = Table(notas_fiscais, colWidths=[1 * inch, 2.5 * inch, 1 * inch, 1 * inch])
-    tabela_nota_fiscal.setStyle(TableStyle([ 
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#4CAF50")),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.gray)
-    ]))
-    elementos.append(tabela_nota_fiscal)
-    elementos.append(Spacer(1, 0.5 * inch))
+    # 4. Tabela de Notas Fiscais, uma tabela por página
+    while (bloco := proximo_bloco()) is not None:
+        relatorio.adicionar_notas([
+            [nota_id, descricao, formatar_valor(valor), data.strftime('%d/%m/%Y')]
+            for nota_id, descricao, valor, data in bloco
+        ])
+    relatorio.adicionar(Spacer(1, 0.5 * inch))
 
     # 5. Resumo Financeiro
-    total = sum([nota.valor for nota in notas])  # Calculando o total das notas
-    total_formatado = f"R$ {total / 100:,.2f}".replace('.', ',')  # Formatação do total
-
-    # Não tente formatar 'total_formatado' novamente, já que ele é uma string formatada
-    resumo_financeiro = [
+    total_formatado = formatar_valor(cabecalho["total"])  # Formatação do total
+    resumo_financeiro = [[descricao, formatar_valor(valor)] for descricao, valor in cabecalho["categorias"]] + [
         ["Subtotal", total_formatado],
         ["Total a Pagar", total_formatado]
     ]
-    tabela_resumo = Table(resumo_financeiro, colWidths=[4 * inch, 2 * inch])
-    tabela_resumo.setStyle(TableStyle([
-        ('BACKGROUND', (-1, -1), (-1, -1), colors.HexColor("#4CAF50")),
-        ('TEXTCOLOR', (-1, -1), (-1, -1), colors.white),
-        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-    ]))
-    elementos.append(tabela_resumo)
-    elementos.append(Spacer(1, 0.5 * inch))
+    tabela_resumo = Table(resumo_financeiro, colWidths=[4 * inch, 2 * inch], style=estilo_tabela_resumo)
+    relatorio.adicionar(tabela_resumo, Spacer(1, 0.5 * inch))
 
     # 6. Espaço para Assinatura
-    elementos.append(Spacer(1, 0.5 * inch))
-    elementos.append(Paragraph("_____________________________________", estilos['Normal']))
-    elementos.append(Paragraph("Assinatura do Cliente", estilos['Normal']))
-    elementos.append(Spacer(1, 0.5 * inch))
-
-    # Construir PDF com rodapé
-    doc.build(elementos, onFirstPage=footer, onLaterPages=footer)
-    print(f"PDF gerado com sucesso: {nome_arquivo}")
\ No newline at end of file
+    relatorio.adicionar(
+        Spacer(1, 0.5 * inch),
+        Paragraph("_____________________________________", estilos['Normal']),
+        Paragraph("Assinatura do Cliente", estilos['Normal']),
+        Spacer(1, 0.5 * inch),
+    )
+
+    relatorio.finalizar()
+    logger.info("PDF renderizado", extra={"notas": cabecalho["qtd_notas"], "paginas": relatorio.page})
+    return buffer.getvalue()
+
+async def carregar_cabecalho_relatorio(codigo_usuario, codigo_planilha):
+    """
+    Busca a planilha e os agregados das suas notas numa única consulta.
+
+    Quantidade, soma dos valores, primeira e última data e maior id saem do
+    banco agrupados por categoria (LEFT JOIN: planilha sem notas ainda devolve
+    uma linha). Os totais da planilha são a soma dos subtotais.
+    """
+    por_categoria = await (
+        Planilha.filter(codigo_planilha=codigo_planilha, codigo_usuario_id=codigo_usuario)
+        .annotate(
+            qtd=Count("notas__id"), total=Sum("notas__valor"),
+            inicio=Min("notas__data"), fim=Max("notas__data"), ultimo=Max("notas__id"),
+        )
+        .group_by("id", "notas__codigo_categoria_id", "notas__codigo_categoria__descricao")
+        .order_by("notas__codigo_categoria__descricao")
+        .values("id", "notas__codigo_categoria__descricao", "qtd", "total", "inicio", "fim", "ultimo")
+    )
+    if not por_categoria:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Essa planilha não existe para esse usuário.")
+
+    categorias = [linha for linha in por_categoria if linha["qtd"]]
+    return {
+        "planilha_id": por_categoria[0]["id"],
+        "codigo_planilha": codigo_planilha,
+        "qtd_notas": sum(linha["qtd"] for linha in categorias),
+        "total": sum(linha["total"] for linha in categorias),
+        "inicio": min((linha["inicio"] for linha in categorias), default=None),
+        "fim": max((linha["fim"] for linha in categorias), default=None),
+        "ultimo": max((linha["ultimo"] for linha in categorias), default=0),
+        "categorias": [(linha["notas__codigo_categoria__descricao"], linha["total"]) for linha in categorias],
+    }
+
+# Colunas impressas na tabela de notas do relatório
+CAMPOS_RELATORIO = ("id", "codigo_categoria__descricao", "valor", "data")
+
+async def blocos_de_notas(planilha_id, campos: tuple = CAMPOS_RELATORIO, tamanho: int = REPORT_CHUNK_SIZE):
+    """
+    Notas da planilha, das mais recentes para as mais antigas, em blocos de `tamanho`.
+
+    Cada bloco é uma consulta com paginação por chave (created_at, id), então o
+    custo por bloco não cresce com a posição, e só as colunas em `campos` são
+    lidas. Cada nota vem como uma tupla na ordem de `campos`.
+    """
+    # As colunas da chave entram na consulta se não estiverem em `campos` (o Tortoise não repete colunas)
+    colunas = tuple(campos) + tuple(chave for chave in ("created_at", "id") if chave not in campos)
+    i_created_at, i_id = colunas.index("created_at"), colunas.index("id")
+
+    ultimo = None
+    while True:
+        consulta = Nota.filter(planilha_id=planilha_id)
+        if ultimo is not None:
+            consulta = consulta.filter(depois_de(*ultimo))
+
+        bloco = await (
+            consulta.order_by("-created_at", "-id")
+            .limit(tamanho)
+            .values_list(*colunas)
+        )
+        if not bloco:
+            return
+
+        yield [linha[:len(campos)] for linha in bloco]
+        if len(bloco) < tamanho:
+            return
+        ultimo = (bloco[-1][i_created_at], bloco[-1][i_id])
+
+async def gerar_pdf(cabecalho) -> bytes:
+    """
+    Renderiza o relatório na thread de relatórios, lendo as notas sob demanda.
+
+    A thread pede cada bloco ao event loop quando termina de desenhar o anterior,
+    então só um bloco de notas fica em memória de cada vez.
+    """
+    loop = asyncio.get_running_loop()
+    blocos = blocos_de_notas(cabecalho["planilha_id"])
+
+    async def proximo():
+        try:
+            return await anext(blocos)
+        except StopAsyncIteration:
+            return None
+
+    def proximo_bloco():
+        return asyncio.run_coroutine_threadsafe(proximo(), loop).result()
+
+    try:
+        return await run_report(renderizar_pdf, cabecalho, proximo_bloco)
+    finally:
+        await blocos.aclose()
+
+async def criar_pdf_nota_fiscal(codigo_usuario, codigo_planilha):
+    """
+    Gera o relatório da planilha, ou devolve o já gerado se nada mudou desde então.
+
+    Um acerto no cache custa a consulta agregada do cabeçalho e a leitura do
+    arquivo, sem as consultas das notas nem o reportlab.
+
+    :return: tupla (bytes do PDF, nome sugerido para o arquivo).
+    """
+    nome_arquivo = nome_relatorio(codigo_usuario, codigo_planilha)
+    cabecalho = await carregar_cabecalho_relatorio(codigo_usuario, codigo_planilha)
+    versao = versao_relatorio(cabecalho)
+
+    pdf = await get_relatorio(codigo_usuario, codigo_planilha, versao)
+    if pdf is not None:
+        return pdf, nome_arquivo
+
+    pdf = await gerar_pdf(cabecalho)
+    await save_relatorio(codigo_usuario, codigo_planilha, versao, pdf)
+
+    logger.info("PDF gerado", extra={"arquivo": nome_arquivo, "bytes": len(pdf)})
+    return pdf, nome_arquivo
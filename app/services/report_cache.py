@@ -0,0 +1,111 @@
+import hashlib
+import logging
+import os
+import threading
+import uuid
+from pathlib import Path
+
+from app.core.config import REPORT_CACHE_DIR, REPORT_CACHE_MAX_BYTES
+from app.core.metrics import Counter, Gauge
+from app.services.workers import run_io
+
+logger = logging.getLogger(__name__)
+
+# Mudanças no layout do PDF invalidam todos os relatórios já gerados
+VERSAO_LAYOUT = 2
+
+_diretorio = Path(REPORT_CACHE_DIR)
+_lock = threading.Lock()
+_estatisticas = {"hits": 0, "misses": 0}
+
+def _hash(texto: str) -> str:
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()[:16]
+
+def _arquivo(codigo_usuario: str, codigo_planilha: str, versao: str) -> Path:
+    # Prefixo por usuário e planilha: invalidar é apagar os arquivos que começam com ele
+    return _diretorio / f"{_hash(codigo_usuario)}-{_hash(codigo_planilha)}-{versao}.pdf"
+
+def versao_relatorio(cabecalho: dict) -> str:
+    """
+    Versão do conteúdo do relatório, a partir dos agregados do cabeçalho.
+
+    Combina a quantidade, a soma dos valores e o maior id das notas da planilha:
+    qualquer nota confirmada ou removida muda a versão, sem consulta extra.
+    """
+    return f"v{VERSAO_LAYOUT}.{cabecalho['qtd_notas']}.{cabecalho['total']}.{cabecalho['ultimo']}"
+
+def _ler(caminho: Path):
+    try:
+        pdf = caminho.read_bytes()
+    except FileNotFoundError:
+        return None
+    # Marca o acesso: a remoção por tamanho começa pelos menos usados
+    os.utime(caminho)
+    return pdf
+
+def _gravar(caminho: Path, pdf: bytes):
+    _diretorio.mkdir(parents=True, exist_ok=True)
+    # Grava num arquivo temporário e renomeia: leitores nunca veem um PDF pela metade
+    temporario = caminho.with_suffix(f".{uuid.uuid4().hex}.tmp")
+    temporario.write_bytes(pdf)
+    os.replace(temporario, caminho)
+    _limitar_tamanho()
+
+def _limitar_tamanho():
+    with _lock:
+        arquivos = []
+        for caminho in _diretorio.glob("*.pdf"):
+            try:
+                info = caminho.stat()
+            except FileNotFoundError:
+                continue
+            arquivos.append((info.st_mtime, info.st_size, caminho))
+
+        total = sum(tamanho for _, tamanho, _ in arquivos)
+        for _, tamanho, caminho in sorted(arquivos):
+            if total <= REPORT_CACHE_MAX_BYTES:
+                break
+            caminho.unlink(missing_ok=True)
+            total -= tamanho
+
+def _remover_planilha(codigo_usuario: str, codigo_planilha: str) -> int:
+    removidos = 0
+    for caminho in _diretorio.glob(f"{_hash(codigo_usuario)}-{_hash(codigo_planilha)}-*.pdf"):
+        caminho.unlink(missing_ok=True)
+        removidos += 1
+    return removidos
+
+async def get_relatorio(codigo_usuario: str, codigo_planilha: str, versao: str):
+    """PDF já gerado para esta versão da planilha, ou None."""
+    pdf = await run_io(_ler, _arquivo(codigo_usuario, codigo_planilha, versao))
+    _estatisticas["hits" if pdf is not None else "misses"] += 1
+    return pdf
+
+async def save_relatorio(codigo_usuario: str, codigo_planilha: str, versao: str, pdf: bytes):
+    try:
+        await run_io(_gravar, _arquivo(codigo_usuario, codigo_planilha, versao), pdf)
+    except OSError as e:
+        # Falha no cache não deve impedir a entrega do relatório
+        logger.warning("erro ao salvar relatório no cache", extra={"erro": str(e)})
+
+async def invalidar_relatorios(codigo_usuario: str, codigo_planilha: str):
+    """
+    Remove os relatórios da planilha; chamado quando uma nota é confirmada nela.
+
+    O relatório só mostra dados da própria planilha, então os das outras
+    planilhas do usuário continuam válidos. Em outras máquinas os arquivos
+    antigos já não são encontrados (a versão mudou) e saem pelo limite de tamanho.
+    """
+    try:
+        await run_io(_remover_planilha, codigo_usuario, codigo_planilha)
+    except OSError as e:
+        logger.warning("erro ao invalidar relatórios", extra={"erro": str(e)})
+
+def cache_stats():
+    total = _estatisticas["hits"] + _estatisticas["misses"]
+    return {**_estatisticas, "hit_ratio": _estatisticas["hits"] / total if total else 0.0}
+
+report_cache_consultas = Counter("report_cache_lookups_total", "Consultas ao cache de relatórios por resultado.",
+                                 ("resultado",), funcao=lambda: dict(_estatisticas))
+report_cache_hit_ratio = Gauge("report_cache_hit_ratio", "Fração dos relatórios servidos do cache.",
+                               funcao=lambda: cache_stats()["hit_ratio"])
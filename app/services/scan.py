@@ -1,205 +1,398 @@
+import asyncio
+import logging
 import cv2
 import numpy as np
 import io
 import base64
-from fastapi import UploadFile
-import requests
-import re
-import os
-from dotenv import load_dotenv
-from app.services.gcs import upload_to_gcs
-
-load_dotenv()
-
-API_KEY = os.getenv('API_KEY')
+import hashlib
+from fastapi import UploadFile, HTTPException, status
+import time
+from contextlib import contextmanager
+from PIL import Image
+from app.core.config import (
+    OCR_MAX_PIXELS, OCR_MAX_BYTES, OCR_JPEG_QUALITY, UPLOAD_MAX_BYTES, UPLOAD_CHUNK_SIZE,
+    SCAN_JPEG_QUALITY, THUMB_MAX_SIDE, MEDIUM_MAX_SIDE, DERIVATIVE_FORMAT, DERIVATIVE_QUALITY,
+)
+from app.core.metrics import Histogram
+from app.services.geometry import correct_perspective
+from app.services.gcs import upload_to_gcs_async, download_from_gcs_async, exclude_many_from_gcs_async
+from app.services.workers import run_io, run_cpu
+from app.services.ocr_cache import get_ocr_result, save_ocr_result
+from app.services.vision import post_annotate, vision_batcher, VisionIndisponivel
+from app.services.extract import extract_lines, extract_value_and_date_spatial
+
+logger = logging.getLogger(__name__)
+
+# Etapas do pipeline (ocr, processamento, upload_scan...) e, dentro do
+# processamento, decode, warp, preprocess e encode
+scan_etapa_duracao = Histogram("scan_stage_duration_seconds", "Duração de cada etapa da digitalização.", ("etapa",))
+
+class ScanImage:
+    """
+    Imagem enviada para digitalização, lida uma única vez.
+
+    Os bytes são mantidos num único objeto imutável e compartilhados entre as
+    etapas sem cópias: o upload recebe um BytesIO sobre o mesmo buffer, o base64
+    da Vision lê de um memoryview e o OpenCV decodifica de um np.frombuffer.
+    Expõe `file`, `filename` e `content_type` como um UploadFile, para que possa
+    ser passada diretamente ao upload_to_gcs.
+    """
+
+    def __init__(self, data: bytes, filename: str, content_type: str):
+        if not data:
+            raise ValueError("Imagem vazia ou não foi lida corretamente.")
+
+        self.data = data
+        self.view = memoryview(data)
+        self.size = len(data)
+        self.filename = filename
+        self.content_type = content_type
+        self.metricas = {"tamanho_bytes": len(data), "etapas_ms": {}}
+        self._sha256 = None
+        self._inicio = time.perf_counter()
+
+    @classmethod
+    async def from_upload(cls, image: UploadFile, max_bytes: int = UPLOAD_MAX_BYTES):
+        """
+        Lê o upload em blocos, numa única passada: valida o tamanho (413 assim que
+        o limite é ultrapassado), identifica o formato real pelos bytes iniciais e
+        calcula o SHA-256 usado pelo cache de OCR.
+
+        Os blocos vão direto para um único BytesIO, cujo getvalue() devolve o
+        próprio buffer interno sem copiar; juntar uma lista de blocos manteria
+        a lista e o resultado vivos ao mesmo tempo (o dobro do upload).
+        """
+        if image.size is not None and image.size > max_bytes:
+            raise _arquivo_grande(max_bytes)
+
+        await image.seek(0)
+        hasher = hashlib.sha256()
+        buffer = io.BytesIO()
+        lidos = 0
+        content_type = None
+
+        while chunk := await image.read(UPLOAD_CHUNK_SIZE):
+            if not lidos:
+                content_type = sniff_content_type(chunk)
+                if content_type is None:
+                    raise ValueError("Formato de arquivo não suportado.")
+
+            lidos += len(chunk)
+            if lidos > max_bytes:
+                raise _arquivo_grande(max_bytes)
+
+            hasher.update(chunk)
+            buffer.write(chunk)
+
+        scan_image = cls(buffer.getvalue(), image.filename, content_type)
+        scan_image._sha256 = hasher.hexdigest()
+        return scan_image
+
+    @classmethod
+    async def from_blob(cls, blob_name: str, max_bytes: int = UPLOAD_MAX_BYTES):
+        """Busca no bucket uma original enviada diretamente pelo cliente."""
+        # Baixa no máximo um byte além do limite, o suficiente para detectar o excesso
+        data = await download_from_gcs_async(blob_name, end=max_bytes)
+        if len(data) > max_bytes:
+            raise _arquivo_grande(max_bytes)
+
+        content_type = sniff_content_type(data)
+        if content_type is None:
+            raise ValueError("Formato de arquivo não suportado.")
+        return cls(data, blob_name, content_type)
+
+    @property
+    def file(self):
+        # BytesIO construído a partir de bytes compartilha o buffer até ser escrito
+        return io.BytesIO(self.data)
+
+    @contextmanager
+    def medir(self, etapa: str):
+        """Registra início e fim da etapa, em ms desde a leitura da imagem."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            fim = time.perf_counter()
+            scan_etapa_duracao.observe(fim - inicio, etapa=etapa)
+            self.metricas["etapas_ms"][etapa] = (
+                round((inicio - self._inicio) * 1000, 1),
+                round((fim - self._inicio) * 1000, 1),
+            )
+
+    @property
+    def sha256(self) -> str:
+        if self._sha256 is None:
+            self._sha256 = hashlib.sha256(self.view).hexdigest()
+        return self._sha256
+
+    def base64(self) -> str:
+        return base64.b64encode(self.view).decode('utf-8')
+
+def _arquivo_grande(max_bytes: int):
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Arquivo maior que o limite de {max_bytes} bytes.",
+    )
+
+# Identifica o formato real da imagem pelos bytes iniciais
+def sniff_content_type(data) -> str | None:
+    if data[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    return None
 
 # Função de pré-processamento
 def preprocess_image(img):
     imgGray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    imgBlur = cv2.GaussianBlur(imgGray, (5, 5), 1)
-    return imgBlur
-
-# Função para detectar texto e contornos
-def detect_text_and_contours(image_file):
-    # Carregar os dados da imagem
-    image_file.file.seek(0)
-    img_data = image_file.file.read()
-
-    if not img_data:
-        raise ValueError("Imagem vazia ou não foi lida corretamente.")
-
-    # Decodificar a imagem para o OpenCV
-    img_array = np.frombuffer(img_data, np.uint8)
-    img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-
+    # Desfoque no próprio buffer em tons de cinza, sem alocar outra imagem
+    return cv2.GaussianBlur(imgGray, (5, 5), 1, dst=imgGray)
+
+# Dimensões da imagem já com a orientação EXIF aplicada, lendo apenas o cabeçalho
+def image_size(data: bytes):
+    with Image.open(io.BytesIO(data)) as header:
+        width, height = header.size
+        # Orientações 5 a 8 giram a imagem em 90°, como o cv2.imdecode faz
+        if header.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+            width, height = height, width
+    return width, height
+
+# Reduz a imagem ao orçamento de OCR; devolve o conteúdo em base64 e a escala (x, y)
+# para levar as coordenadas da Vision de volta à imagem original
+def prepare_ocr_image(image: ScanImage):
+    width, height = image_size(image.data)
+    pixels = width * height
+
+    dentro_pixels = not OCR_MAX_PIXELS or pixels <= OCR_MAX_PIXELS
+    dentro_bytes = not OCR_MAX_BYTES or len(image.data) <= OCR_MAX_BYTES
+    if dentro_pixels and dentro_bytes:
+        return image.base64(), (1.0, 1.0)
+
+    fator = min(1.0, (OCR_MAX_PIXELS / pixels) ** 0.5) if OCR_MAX_PIXELS else 1.0
+
+    # Decodificação reduzida (o JPEG é reduzido já na DCT) no maior fator que
+    # ainda não fica abaixo do tamanho alvo; o ajuste fino é feito com resize
+    flag = cv2.IMREAD_COLOR
+    for reducao, flag_reduzida in ((8, cv2.IMREAD_REDUCED_COLOR_8),
+                                   (4, cv2.IMREAD_REDUCED_COLOR_4),
+                                   (2, cv2.IMREAD_REDUCED_COLOR_2)):
+        if 1 / reducao >= fator:
+            flag = flag_reduzida
+            break
+
+    img = cv2.imdecode(np.frombuffer(image.view, np.uint8), flag)
     if img is None:
         raise ValueError("Falha ao decodificar a imagem.")
 
-    # Codificar a imagem para base64 para envio para a API
-    base64_image = base64.b64encode(img_data).decode('utf-8')
-
-    # Enviar para a Google Vision API
-    url = f"https://vision.googleapis.com/v1/images:annotate?key={API_KEY}"
-    payload = {
-        "requests": [
-            {
-                "image": {"content": base64_image},
-                "features": [{"type": "DOCUMENT_TEXT_DETECTION"}],
-            }
-        ]
+    alvo = (max(1, int(width * fator)), max(1, int(height * fator)))
+    if (img.shape[1], img.shape[0]) != alvo:
+        img = cv2.resize(img, alvo, interpolation=cv2.INTER_AREA)
+
+    # Reduz a qualidade do JPEG até caber no limite de bytes
+    qualidade = OCR_JPEG_QUALITY
+    while True:
+        _, img_encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, qualidade])
+        if not OCR_MAX_BYTES or img_encoded.nbytes <= OCR_MAX_BYTES or qualidade <= 40:
+            break
+        qualidade -= 10
+
+    image.metricas["ocr_bytes"] = int(img_encoded.nbytes)
+    image.metricas["ocr_dimensoes"] = (img.shape[1], img.shape[0])
+
+    escala = (width / img.shape[1], height / img.shape[0])
+    return base64.b64encode(img_encoded).decode('utf-8'), escala
+
+# Monta a requisição da Vision para uma imagem, reduzida ao orçamento de OCR
+def build_vision_request(image: ScanImage):
+    base64_image, escala = prepare_ocr_image(image)
+    vision_request = {
+        "image": {"content": base64_image},
+        "features": [{"type": "DOCUMENT_TEXT_DETECTION"}],
     }
+    return vision_request, escala
 
-    # Enviar a solicitação
-    response = requests.post(url, json=payload)
-    response_data = response.json()
+# Extrai vértices, texto e linhas (reconstruídas pelas caixas das palavras) da resposta da Vision
+def parse_vision_response(response_data: dict, escala):
+    escala_x, escala_y = escala
 
     if "error" in response_data:
         raise Exception(f"Erro da API Google Vision: {response_data['error']['message']}")
 
     # Obter as anotações de texto
-    annotations = response_data.get("responses", [{}])[0].get("fullTextAnnotation", None)
+    annotations = response_data.get("fullTextAnnotation", None)
     if not annotations or "pages" not in annotations:
-        print("Nenhum texto detectado.")
-        return None, None
+        logger.info("nenhum texto detectado")
+        return None, None, None
 
     blocks = annotations["pages"][0].get("blocks", [])
     if not blocks:
-        print("Nenhum bloco de texto detectado.")
-        return None, None
+        logger.info("nenhum bloco de texto detectado")
+        return None, None, None
 
-    # Coletar vértices
+    # Coletar vértices, nas coordenadas da imagem original
     all_vertices = []
     for block in blocks:
         bounding_box = block.get("boundingBox", {})
         vertices = bounding_box.get("vertices", [])
         for vertex in vertices:
-            x = vertex.get("x", 0)
-            y = vertex.get("y", 0)
+            x = round(vertex.get("x", 0) * escala_x)
+            y = round(vertex.get("y", 0) * escala_y)
             all_vertices.append((x, y))
 
-    return all_vertices, annotations.get("text", "")
-
-# Função para corrigir a perspectiva da imagem
-def correct_perspective(img, vertices):
-    if len(vertices) < 4:
-        print("Número insuficiente de vértices para correção.")
+    return all_vertices, annotations.get("text", ""), extract_lines(annotations)
+
+# Função para detectar texto e contornos (uma imagem por requisição, sem agrupamento)
+async def detect_text_and_contours(image: ScanImage):
+    vision_request, escala = await run_io(build_vision_request, image)
+    response_data = await post_annotate([vision_request])
+    return parse_vision_response(response_data[0] if response_data else {}, escala)
+
+# Versão assíncrona: a requisição entra no lote da Vision junto com as demais em andamento
+async def detect_text_and_contours_batched(image: ScanImage):
+    # Em threads mesmo com SCAN_POOL=process: a redução atualiza image.metricas
+    vision_request, escala = await run_io(build_vision_request, image)
+    response_data = await vision_batcher.annotate(vision_request)
+    return parse_vision_response(response_data, escala)
+
+# Reduz a imagem para que o maior lado não passe de max_lado
+def resize_max_side(img, max_lado: int):
+    altura, largura = img.shape[:2]
+    if max(altura, largura) <= max_lado:
         return img
-
-    x_coords = [v[0] for v in vertices]
-    y_coords = [v[1] for v in vertices]
-
-    min_x, max_x = min(x_coords), max(x_coords)
-    min_y, max_y = min(y_coords), max(y_coords)
-
-    # Definir os pontos de origem e destino para correção
-    src_points = np.float32([
-        [min_x, min_y],
-        [max_x, min_y],
-        [max_x, max_y],
-        [min_x, max_y]
-    ])
-
-    dst_points = np.float32([
-        [0, 0],
-        [max_x - min_x, 0],
-        [max_x - min_x, max_y - min_y],
-        [0, max_y - min_y]
-    ])
-
-    # Aplicar a transformação de perspectiva
-    matrix = cv2.getPerspectiveTransform(src_points, dst_points)
-    corrected_img = cv2.warpPerspective(img, matrix, (int(max_x - min_x), int(max_y - min_y)))
-    return corrected_img
-
-# Função principal para processar a imagem
-def execute_scan(image: UploadFile):
+    fator = max_lado / max(altura, largura)
+    return cv2.resize(img, (max(1, round(largura * fator)), max(1, round(altura * fator))),
+                      interpolation=cv2.INTER_AREA)
+
+# Codifica um derivado para as listagens: WebP ou JPEG progressivo
+def encode_derivative(img):
+    if DERIVATIVE_FORMAT == "webp":
+        _, encoded = cv2.imencode('.webp', img, [cv2.IMWRITE_WEBP_QUALITY, DERIVATIVE_QUALITY])
+        return encoded.tobytes(), "image/webp"
+
+    _, encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, DERIVATIVE_QUALITY,
+                                            cv2.IMWRITE_JPEG_PROGRESSIVE, 1])
+    return encoded.tobytes(), "image/jpeg"
+
+@contextmanager
+def _medir_passo(tempos: dict, passo: str):
+    inicio = time.perf_counter()
     try:
-        # Detectar texto e contornos
-        vertices, text = detect_text_and_contours(image)
-        if vertices is None:
-            raise ValueError("Nenhum contorno válido encontrado.")
+        yield
+    finally:
+        tempos[passo] = time.perf_counter() - inicio
+
+# Função de CPU: decodifica, pré-processa, corrige a perspectiva e codifica a
+# digitalização em JPEG, junto com a versão média e a miniatura.
+# A imagem é decodificada uma única vez em todo o pipeline, aqui.
+# Devolve também a duração de cada passo, em segundos: com SCAN_POOL=process
+# ela roda em outro processo e as métricas são registradas por quem chamou.
+def render_scan(img_data: bytes, vertices):
+    tempos = {}
+
+    with _medir_passo(tempos, "decode"):
+        img_array = np.frombuffer(img_data, np.uint8)
+        img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
 
-        valor_pago, data_extraida = extract_value_and_date(text)
-        print(f"Valor extraído: R$ {valor_pago}")
-        print(f"Data extraída: {data_extraida}")
+    if img is None:
+        raise ValueError("Falha ao decodificar a imagem após o pré-processamento.")
 
-        image.file.seek(0)
-        img_data = image.file.read()
+    # Corrigir perspectiva antes do pré-processamento: assim a conversão para
+    # tons de cinza e o desfoque rodam só sobre a região da nota
+    with _medir_passo(tempos, "warp"):
+        img_recorte = correct_perspective(img, vertices)
 
-        if not img_data:
-            raise ValueError("Imagem não foi lida corretamente.")
+    with _medir_passo(tempos, "preprocess"):
+        img_scan = preprocess_image(img_recorte)
 
-        img_array = np.frombuffer(img_data, np.uint8)
-        img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-
-        if img is None:
-            raise ValueError("Falha ao decodificar a imagem após o pré-processamento.")
+    with _medir_passo(tempos, "encode"):
+        _, img_encoded = cv2.imencode('.jpg', img_scan, [cv2.IMWRITE_JPEG_QUALITY, SCAN_JPEG_QUALITY])
 
-        imgPreprocessed = preprocess_image(img)
+        # A miniatura sai da versão média, que já é bem menor que a digitalização
+        img_medium = resize_max_side(img_scan, MEDIUM_MAX_SIDE)
+        img_thumb = resize_max_side(img_medium, THUMB_MAX_SIDE)
 
-        # Corrigir perspectiva
-        img_scan = correct_perspective(imgPreprocessed, vertices)
+        renderizadas = {
+            "scan": (img_encoded.tobytes(), "image/jpeg"),
+            "medium": encode_derivative(img_medium),
+            "thumb": encode_derivative(img_thumb),
+        }
 
-        # Salvar a imagem processada em memória para o upload
-        _, img_encoded = cv2.imencode('.jpg', img_scan)
-        img_bytes = io.BytesIO(img_encoded.tobytes())
+    return renderizadas, tempos
 
-        # Criar um novo UploadFile simulando o arquivo processado
-        processed_image = UploadFile(
-            filename=f"processed_{image.filename}",
-            file=img_bytes,
-            headers={"content-type": "image/jpeg"}
-        )
+# Função principal para processar a imagem
+async def execute_scan(image: ScanImage, on_stage=None):
+    """
+    Executa OCR, correção de perspectiva e upload da imagem digitalizada.
+
+    :param on_stage: callback opcional chamado com o nome de cada etapa ao iniciá-la.
+    :raises HTTPException: 422 se a imagem não puder ser processada.
+    """
+    def etapa(nome):
+        if on_stage:
+            on_stage(nome)
+        return image.medir(nome)
 
-        # Fazer o upload da imagem processada para o bucket
-        imagem_url = upload_to_gcs(processed_image)
+    try:
+        # Detectar texto e contornos (requisição à Vision agrupada com as concorrentes)
+        # Reenvios da mesma foto reaproveitam o OCR anterior, sem chamar a Vision
+        with etapa("ocr"):
+            cached = await get_ocr_result(image.sha256)
+            if cached:
+                vertices, text, linhas = cached
+                image.metricas["ocr_cache"] = True
+            else:
+                vertices, text, linhas = await detect_text_and_contours_batched(image)
+                if vertices is None:
+                    raise ValueError("Nenhum contorno válido encontrado.")
+                await save_ocr_result(image.sha256, vertices, text, linhas)
+
+        valor_pago, data_extraida = extract_value_and_date_spatial(linhas, text)
+        logger.info("valor e data extraídos", extra={"valor": valor_pago, "data": data_extraida})
+
+        # Etapas de OpenCV no pool de CPU, sobre os mesmos bytes já lidos
+        with etapa("processamento"):
+            renderizadas, tempos = await run_cpu(render_scan, image.data, vertices)
+        for passo, duracao in tempos.items():
+            scan_etapa_duracao.observe(duracao, etapa=passo)
+
+        # Fazer o upload da imagem processada e dos derivados para o bucket, em paralelo
+        with etapa("upload_scan"):
+            uploads = []
+            for variante in ("scan", "thumb", "medium"):
+                dados, content_type = renderizadas[variante]
+                uploads.append(upload_to_gcs_async(ScanImage(dados, f"{variante}_{image.filename}", content_type)))
+            urls = await asyncio.gather(*uploads, return_exceptions=True)
+
+            # Se algum envio falhou, os que deram certo ficariam órfãos no bucket
+            erros = [url for url in urls if isinstance(url, BaseException)]
+            if erros:
+                enviadas = [url for url in urls if isinstance(url, str)]
+                if enviadas:
+                    await exclude_many_from_gcs_async(enviadas)
+                raise erros[0]
+            imagem_url, thumb_url, medium_url = urls
+
+        image.metricas["bytes_derivados"] = {variante: len(dados) for variante, (dados, _) in renderizadas.items()}
 
         return {
             "imagem_url": imagem_url,
+            "imagem_thumb_url": thumb_url,
+            "imagem_medium_url": medium_url,
             "valor_pago": valor_pago,
             "data_extraida": data_extraida
         }
+    except HTTPException:
+        raise
+    except VisionIndisponivel as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
     except Exception as e:
-        print(f"Erro ao processar a imagem: {e}")
-        return None
-
-# Função para extrair o valor e a data do texto
-def extract_value_and_date(text):
-    valor_regex = r"\d{1,3}(?:[.,]\d{3})*[.,]\d{2}"
-    date_regex = r"\b(\d{2}/\d{2}/\d{4})\b|\b(\d{4}-\d{2}-\d{2})\b"
-    
-    valores = re.findall(valor_regex, text)
-    datas = re.findall(date_regex, text)
-
-    keywords = ["VALOR TOTAL", "VALOR A PAGAR", "VALOR PAGO"]
-    lower_text = text.lower()
-    valor_pago = 0.0
-
-    def clean_value(value):
-        if "," in value and "." in value:
-            if value.index(",") > value.index("."):
-                return float(value.replace(".", "").replace(",", "."))
-            else:
-                return float(value.replace(",", ""))
-        elif "," in value:
-            return float(value.replace(",", "."))
-        else:
-            return float(value)
-
-    for keyword in keywords:
-        keyword_index = lower_text.find(keyword.lower())
-        if keyword_index != -1:
-            substring_around = text[max(0, keyword_index - 50):keyword_index + 50]
-            valores_proximos = re.findall(valor_regex, substring_around)
-            if valores_proximos:
-                valores_proximos_convertidos = [clean_value(v) for v in valores_proximos]
-                valor_pago = max(valores_proximos_convertidos)
-                break
-
-    if not valor_pago and valores:
-        valor_pago = max([clean_value(v) for v in valores])
-
-    data_extraida = datas[0][0] if datas else ""
-
-    valor_pago_formatado = f"{valor_pago:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-    return valor_pago_formatado, data_extraida
+        logger.warning("erro ao processar a imagem", extra={"erro": str(e)})
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Não foi possível processar a imagem: {str(e)}"
+        )
@@ -0,0 +1,261 @@
+import asyncio
+import json
+import os
+import random
+import time
+import httpx
+from dotenv import load_dotenv
+
+from app.core.config import (
+    VISION_URL, VISION_BATCH_WINDOW_MS, VISION_BATCH_SIZE, VISION_BATCH_MAX_BYTES,
+    VISION_CONNECT_TIMEOUT, VISION_READ_TIMEOUT, VISION_MAX_CONNECTIONS, VISION_MAX_RETRIES,
+    VISION_BACKOFF_BASE, VISION_BREAKER_FAILURES, VISION_BREAKER_COOLDOWN, VISION_RATE_LIMIT, VISION_FIELDS,
+)
+
+from app.core.metrics import Gauge, Histogram
+
+load_dotenv()
+
+vision_duracao = Histogram("vision_request_duration_seconds", "Duração de cada tentativa de chamada à Vision.", ("status",))
+vision_lote = Histogram("vision_batch_images", "Imagens por chamada images:annotate.", buckets=(1, 2, 4, 8, 16))
+
+API_KEY = os.getenv('API_KEY')
+
+class VisionIndisponivel(Exception):
+    """A Vision está degradada e o circuito está aberto; a chamada nem foi tentada."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Google Vision indisponível no momento.")
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """Abre após `limite_falhas` falhas seguidas e rejeita chamadas por `tempo_aberto` segundos."""
+
+    def __init__(self, limite_falhas: int = VISION_BREAKER_FAILURES, tempo_aberto: int = VISION_BREAKER_COOLDOWN):
+        self.limite_falhas = limite_falhas
+        self.tempo_aberto = tempo_aberto
+        self.falhas = 0
+        self.aberto_ate = 0.0
+
+    def permitir(self):
+        restante = self.aberto_ate - time.monotonic()
+        if restante > 0:
+            raise VisionIndisponivel(retry_after=int(restante) + 1)
+
+    def sucesso(self):
+        self.falhas = 0
+
+    def falha(self):
+        self.falhas += 1
+        if self.falhas >= self.limite_falhas:
+            self.aberto_ate = time.monotonic() + self.tempo_aberto
+            self.falhas = 0
+
+class TokenBucket:
+    """Limita a taxa de imagens enviadas para ficar dentro da cota da Vision."""
+
+    def __init__(self, taxa: float = VISION_RATE_LIMIT, capacidade: float | None = None):
+        self.taxa = taxa
+        self.capacidade = capacidade or max(taxa, VISION_BATCH_SIZE)
+        self.tokens = self.capacidade
+        self.atualizado_em = time.monotonic()
+
+    async def adquirir(self, tokens: int = 1):
+        if not self.taxa:
+            return
+
+        tokens = min(tokens, self.capacidade)
+        while True:
+            agora = time.monotonic()
+            self.tokens = min(self.capacidade, self.tokens + (agora - self.atualizado_em) * self.taxa)
+            self.atualizado_em = agora
+
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return
+            await asyncio.sleep((tokens - self.tokens) / self.taxa)
+
+def _compactar(obj: dict) -> dict:
+    """
+    Chamado pelo decodificador JSON ao fechar cada objeto, de dentro para fora.
+
+    Cada palavra é reduzida à caixa e ao texto assim que termina de ser lida,
+    então os símbolos (um objeto por caractere) são descartados na hora e a
+    árvore completa da resposta nunca fica inteira em memória.
+    """
+    obj.pop("confidence", None)
+    obj.pop("property", None)
+    if "symbols" in obj:
+        return {
+            "boundingBox": obj.get("boundingBox", {}),
+            "text": "".join(symbol.get("text", "") for symbol in obj["symbols"]),
+        }
+    return obj
+
+def parse_annotate_body(body: bytes) -> dict:
+    """Decodifica a resposta de images:annotate já na forma enxuta usada pela extração."""
+    return json.loads(body, object_hook=_compactar)
+
+class VisionClient:
+    """
+    Cliente HTTP assíncrono e compartilhado para a Google Vision.
+
+    Mantém conexões keep-alive abertas entre as chamadas, aplica timeouts de
+    conexão e leitura, repete 429/5xx com backoff exponencial e jitter e falha
+    rápido enquanto o circuito estiver aberto.
+    """
+
+    def __init__(self, base_url: str = VISION_URL, api_key: str | None = API_KEY,
+                 max_tentativas: int = VISION_MAX_RETRIES, taxa: float = VISION_RATE_LIMIT):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.max_tentativas = max_tentativas
+        self.breaker = CircuitBreaker()
+        self.limiter = TokenBucket(taxa)
+        self._client = None
+
+    async def start(self):
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(VISION_READ_TIMEOUT, connect=VISION_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=VISION_MAX_CONNECTIONS,
+                                max_keepalive_connections=VISION_MAX_CONNECTIONS),
+        )
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def annotate(self, vision_requests: list) -> list:
+        """
+        Envia uma ou mais imagens numa única chamada a images:annotate.
+
+        :return: lista de respostas, na mesma ordem das requisições.
+        :raises VisionIndisponivel: se o circuito estiver aberto.
+        """
+        if self._client is None:
+            await self.start()
+
+        self.breaker.permitir()
+        await self.limiter.adquirir(len(vision_requests))
+        vision_lote.observe(len(vision_requests))
+
+        params = {"key": self.api_key}
+        if VISION_FIELDS:
+            params["fields"] = VISION_FIELDS
+
+        erro = None
+        for tentativa in range(self.max_tentativas + 1):
+            espera = VISION_BACKOFF_BASE * 2 ** tentativa * random.uniform(0.5, 1.5)
+            inicio = time.perf_counter()
+            try:
+                response = await self._client.post(
+                    "/v1/images:annotate",
+                    params=params,
+                    json={"requests": vision_requests},
+                )
+            except httpx.TransportError as e:
+                vision_duracao.observe(time.perf_counter() - inicio, status="erro_conexao")
+                erro = Exception(f"Erro de conexão com a Google Vision: {e!r}")
+            else:
+                vision_duracao.observe(time.perf_counter() - inicio, status=response.status_code)
+                if response.status_code == 429 or response.status_code >= 500:
+                    erro = Exception(f"Google Vision respondeu {response.status_code}.")
+                    retry_after = response.headers.get("Retry-After", "")
+                    if retry_after.isdigit():
+                        espera = max(espera, int(retry_after))
+                else:
+                    self.breaker.sucesso()
+                    response_data = parse_annotate_body(response.content)
+                    if "error" in response_data:
+                        raise Exception(f"Erro da API Google Vision: {response_data['error']['message']}")
+                    return response_data.get("responses", [])
+
+            if tentativa < self.max_tentativas:
+                await asyncio.sleep(espera)
+
+        self.breaker.falha()
+        raise erro
+
+vision_client = VisionClient()
+
+vision_circuito_aberto = Gauge("vision_circuit_open", "1 enquanto o circuito da Vision está aberto.",
+                               funcao=lambda: int(vision_client.breaker.aberto_ate > time.monotonic()))
+
+async def post_annotate(vision_requests: list) -> list:
+    return await vision_client.annotate(vision_requests)
+
+class VisionBatcher:
+    """
+    Agrupa requisições concorrentes à Vision em chamadas images:annotate com várias imagens.
+
+    A primeira requisição abre uma janela de `janela_ms`; tudo que chegar nesse
+    intervalo segue no mesmo lote, que é enviado antes se atingir `max_lote`
+    imagens ou `max_bytes` de conteúdo. Cada chamador recebe apenas a sua resposta.
+    """
+
+    def __init__(self, janela_ms: int = VISION_BATCH_WINDOW_MS, max_lote: int = VISION_BATCH_SIZE,
+                 max_bytes: int = VISION_BATCH_MAX_BYTES, enviar=None):
+        self.janela = janela_ms / 1000
+        self.max_lote = max(1, max_lote)
+        self.max_bytes = max_bytes
+        self.enviar = enviar
+        self.chamadas = 0
+        self._pendentes = []
+        self._bytes_pendentes = 0
+        self._timer = None
+        # O loop só guarda referência fraca às tasks; sem esta, um lote em voo pode ser coletado
+        self._tarefas = set()
+
+    async def annotate(self, vision_request: dict) -> dict:
+        loop = asyncio.get_running_loop()
+        tamanho = len(vision_request.get("image", {}).get("content", ""))
+
+        if self._pendentes and self._bytes_pendentes + tamanho > self.max_bytes:
+            self._enviar_pendentes()
+
+        future = loop.create_future()
+        self._pendentes.append((vision_request, future))
+        self._bytes_pendentes += tamanho
+
+        if len(self._pendentes) >= self.max_lote:
+            self._enviar_pendentes()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.janela, self._enviar_pendentes)
+
+        return await future
+
+    def _enviar_pendentes(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        lote, self._pendentes, self._bytes_pendentes = self._pendentes, [], 0
+        if lote:
+            tarefa = asyncio.create_task(self._enviar_lote(lote))
+            self._tarefas.add(tarefa)
+            tarefa.add_done_callback(self._tarefas.discard)
+
+    async def _enviar_lote(self, lote):
+        self.chamadas += 1
+        enviar = self.enviar or post_annotate
+        try:
+            respostas = await enviar([vision_request for vision_request, _ in lote])
+        except Exception as e:
+            for _, future in lote:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for i, (_, future) in enumerate(lote):
+            if not future.done():
+                future.set_result(respostas[i] if i < len(respostas) else {})
+
+vision_batcher = VisionBatcher()
+
+async def start_vision_client():
+    await vision_client.start()
+
+async def close_vision_client():
+    await vision_client.close()
@@ -0,0 +1,116 @@
+import asyncio
+import contextvars
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from fastapi import HTTPException, status
+
+from app.core.config import SCAN_WORKERS, SCAN_POOL, SCAN_QUEUE_SIZE, SCAN_RETRY_AFTER, REPORT_WORKERS
+from app.core.metrics import Gauge
+
+# Etapas de I/O bloqueante (Google Vision, GCS) rodam sempre em threads
+io_executor = ThreadPoolExecutor(max_workers=SCAN_WORKERS, thread_name_prefix="scan-io")
+
+# Etapas de CPU (OpenCV) rodam em threads ou processos, conforme SCAN_POOL. O pool
+# é criado no startup (ou no primeiro uso), não na importação, e os processos são
+# iniciados com spawn: um fork copiaria conexões do Tortoise, o cliente httpx e os
+# locks de logging do processo pai
+_cpu_executor = None
+_cpu_executor_lock = threading.Lock()
+
+def get_cpu_executor():
+    global _cpu_executor
+
+    if _cpu_executor is None:
+        with _cpu_executor_lock:
+            if _cpu_executor is None:
+                if SCAN_POOL == "process":
+                    _cpu_executor = ProcessPoolExecutor(
+                        max_workers=SCAN_WORKERS, mp_context=multiprocessing.get_context("spawn")
+                    )
+                else:
+                    _cpu_executor = ThreadPoolExecutor(max_workers=SCAN_WORKERS, thread_name_prefix="scan-cpu")
+    return _cpu_executor
+
+# Relatórios rodam em threads próprias: consomem as notas do event loop enquanto
+# desenham as páginas e podem levar minutos, sem ocupar os pools da digitalização
+report_executor = ThreadPoolExecutor(max_workers=REPORT_WORKERS, thread_name_prefix="report")
+
+# Digitalizações em andamento (executando ou aguardando na fila) neste worker
+_em_andamento = 0
+
+def scans_em_andamento() -> int:
+    return _em_andamento
+
+pool_workers = Gauge("pool_workers", "Workers configurados em cada pool.", ("pool",),
+                     funcao=lambda: {"io": SCAN_WORKERS, "cpu": SCAN_WORKERS, "report": REPORT_WORKERS})
+pool_tarefas = Gauge("pool_tasks_in_flight", "Tarefas executando ou aguardando em cada pool.", ("pool",))
+scans_ativos = Gauge("scans_in_flight", "Digitalizações em andamento neste worker.", funcao=scans_em_andamento)
+
+@asynccontextmanager
+async def scan_slot():
+    """
+    Reserva uma vaga no pool de digitalização.
+
+    Se todos os workers estiverem ocupados e a fila estiver cheia, rejeita a
+    requisição com 503 e o cabeçalho Retry-After em vez de enfileirar sem limite.
+    """
+    global _em_andamento
+
+    if _em_andamento >= SCAN_WORKERS + SCAN_QUEUE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servidor ocupado processando outras notas. Tente novamente em instantes.",
+            headers={"Retry-After": str(SCAN_RETRY_AFTER)},
+        )
+
+    _em_andamento += 1
+    try:
+        yield
+    finally:
+        _em_andamento -= 1
+
+async def run_io(func, *args, **kwargs):
+    """Executa uma função de I/O bloqueante no pool de threads, sem travar o event loop."""
+    loop = asyncio.get_running_loop()
+    # Leva o contexto (id de correlação dos logs) para a thread
+    contexto = contextvars.copy_context()
+    pool_tarefas.inc(pool="io")
+    try:
+        return await loop.run_in_executor(io_executor, partial(contexto.run, func, *args, **kwargs))
+    finally:
+        pool_tarefas.dec(pool="io")
+
+async def run_cpu(func, *args, **kwargs):
+    """Executa uma função de CPU no pool configurado (threads ou processos)."""
+    loop = asyncio.get_running_loop()
+    pool_tarefas.inc(pool="cpu")
+    try:
+        return await loop.run_in_executor(get_cpu_executor(), partial(func, *args, **kwargs))
+    finally:
+        pool_tarefas.dec(pool="cpu")
+
+async def run_report(func, *args, **kwargs):
+    """Executa a geração de um relatório nas threads de relatório."""
+    loop = asyncio.get_running_loop()
+    contexto = contextvars.copy_context()
+    pool_tarefas.inc(pool="report")
+    try:
+        return await loop.run_in_executor(report_executor, partial(contexto.run, func, *args, **kwargs))
+    finally:
+        pool_tarefas.dec(pool="report")
+
+def start_workers():
+    get_cpu_executor()
+
+def shutdown_workers():
+    global _cpu_executor
+
+    io_executor.shutdown(wait=True)
+    with _cpu_executor_lock:
+        if _cpu_executor is not None:
+            _cpu_executor.shutdown(wait=True)
+            _cpu_executor = None
+    report_executor.shutdown(wait=True)
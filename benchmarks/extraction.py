@@ -0,0 +1,52 @@
+"""
+Acurácia e vazão da extração de valor e data sobre o corpus rotulado.
+
+Compara a extração pelo texto corrido (janela de ±50 caracteres) com a
+extração espacial pelas caixas das palavras, usando as respostas em
+benchmarks/fixtures/extracao.json (geradas por benchmarks.receipts).
+
+Esse corpus é sintético: o layout do gerador (valores numa coluna à direita,
+lidos depois dos rótulos) é justamente o que o texto corrido não resolve, então
+os números dele não valem como acurácia em notas reais. Para isso, passe um
+arquivo no mesmo formato com respostas gravadas da Vision real
+([{"fullTextAnnotation": ..., "esperado": {"valor": ..., "data": ...}}]).
+
+Uso: python -m benchmarks.extraction [repeticoes] [corpus.json]
+"""
+import json
+import sys
+import time
+from pathlib import Path
+
+from app.services.extract import extract_lines, extract_value_and_date, extract_value_and_date_spatial
+
+CORPUS = Path(__file__).parent / "fixtures" / "extracao.json"
+
+def texto_corrido(annotation):
+    return extract_value_and_date(annotation["text"])
+
+def espacial(annotation):
+    return extract_value_and_date_spatial(extract_lines(annotation), annotation["text"])
+
+def avaliar(extrator, corpus, repeticoes):
+    acertos = 0
+    for item in corpus:
+        valor, data = extrator(item["fullTextAnnotation"])
+        acertos += valor == item["esperado"]["valor"] and data == item["esperado"]["data"]
+
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        for item in corpus:
+            extrator(item["fullTextAnnotation"])
+    duracao = time.perf_counter() - inicio
+
+    return {"acuracia": acertos / len(corpus), "notas_por_segundo": repeticoes * len(corpus) / duracao}
+
+if __name__ == "__main__":
+    repeticoes = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    corpus = json.loads(Path(sys.argv[2] if len(sys.argv) > 2 else CORPUS).read_text())
+    print(json.dumps({
+        "notas": len(corpus),
+        "texto_corrido": avaliar(texto_corrido, corpus, repeticoes),
+        "espacial": avaliar(espacial, corpus, repeticoes),
+    }, indent=2))
@@ -0,0 +1,162 @@
+"""
+Emulador local mínimo do Google Cloud Storage, em memória.
+
+Implementa o subconjunto da API JSON usado pela aplicação: upload multipart,
+download de mídia (com Range), leitura pela URL pública e exclusão, avulsa ou
+em lote (multipart/mixed de DELETEs), com uma latência fixa por requisição.
+
+Uso: python -m benchmarks.fake_gcs [porta]
+     GCS_ENDPOINT=http://127.0.0.1:<porta> aponta a aplicação para ele.
+"""
+import json
+import re
+import sys
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+UPLOAD_RE = re.compile(r"^/upload/storage/v1/b/([^/]+)/o$")
+OBJETO_RE = re.compile(r"^/(?:download/)?storage/v1/b/([^/]+)/o/(.+)$")
+PUBLICO_RE = re.compile(r"^/([^/]+)/(.+)$")
+LOTE_PATH = "/batch/storage/v1"
+FRONTEIRA_LOTE = "batch_fake_gcs"
+
+def _ler_multipart(content_type: str, corpo: bytes):
+    """Devolve (metadados, conteúdo, content_type) de um upload multipart/related."""
+    mensagem = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + corpo
+    )
+    metadados, midia = list(mensagem.iter_parts())
+    return json.loads(metadados.get_content()), midia.get_payload(decode=True), midia.get_content_type()
+
+def _ler_lote(content_type: str, corpo: bytes):
+    """Devolve (método, caminho) de cada sub-requisição de um lote multipart/mixed."""
+    mensagem = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + corpo
+    )
+    requisicoes = []
+    for parte in mensagem.iter_parts():
+        metodo, uri, _ = parte.get_payload().split("\n", 1)[0].split(" ", 2)
+        requisicoes.append((metodo, urlsplit(uri).path))
+    return requisicoes
+
+def _resposta_lote(respostas) -> bytes:
+    """Monta o corpo multipart/mixed com uma resposta HTTP (codigo, corpo) por sub-requisição."""
+    partes = []
+    for indice, (codigo, corpo) in enumerate(respostas, start=1):
+        motivo = HTTPStatus(codigo).phrase
+        partes.append(
+            f"--{FRONTEIRA_LOTE}\r\nContent-Type: application/http\r\nContent-ID: <response-{indice}>\r\n\r\n"
+            f"HTTP/1.1 {codigo} {motivo}\r\nContent-Type: application/json\r\nContent-Length: {len(corpo)}\r\n\r\n"
+            f"{corpo.decode()}\r\n"
+        )
+    return ("".join(partes) + f"--{FRONTEIRA_LOTE}--\r\n").encode()
+
+def start_fake_gcs(porta: int = 0, latencia_ms: float = 20):
+    """Sobe o emulador numa thread e devolve (servidor, url_base); os objetos ficam em servidor.objetos."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def _responder(self, codigo: int, corpo: bytes = b"", content_type: str = "application/json"):
+            self.send_response(codigo)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def _recurso(self, bucket: str, nome: str):
+            conteudo, content_type = self.server.objetos[(bucket, nome)]
+            return json.dumps({"kind": "storage#object", "bucket": bucket, "name": nome,
+                               "size": str(len(conteudo)), "contentType": content_type,
+                               "generation": "1"}).encode()
+
+        def do_POST(self):
+            self.server.requisicoes += 1
+            time.sleep(latencia_ms / 1000)
+            corpo = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            caminho = urlsplit(self.path)
+            if caminho.path == LOTE_PATH:
+                return self._lote(corpo)
+
+            match = UPLOAD_RE.match(caminho.path)
+            if not match or "uploadType=multipart" not in caminho.query:
+                return self._responder(400, b'{"error": {"message": "Somente upload multipart."}}')
+
+            metadados, conteudo, content_type = _ler_multipart(self.headers["Content-Type"], corpo)
+            bucket = match.group(1)
+            self.server.objetos[(bucket, metadados["name"])] = (conteudo, metadados.get("contentType", content_type))
+            self._responder(200, self._recurso(bucket, metadados["name"]))
+
+        def _lote(self, corpo: bytes):
+            respostas = []
+            for metodo, caminho in _ler_lote(self.headers["Content-Type"], corpo):
+                if metodo != "DELETE":
+                    respostas.append((400, b'{"error": {"message": "Somente DELETE em lote."}}'))
+                else:
+                    respostas.append(self._excluir(caminho))
+            self._responder(200, _resposta_lote(respostas), f"multipart/mixed; boundary={FRONTEIRA_LOTE}")
+
+        def _excluir(self, caminho: str):
+            """Exclui o objeto do caminho da API JSON; devolve (codigo, corpo) da resposta."""
+            match = OBJETO_RE.match(caminho)
+            chave = (match.group(1), unquote(match.group(2))) if match else None
+            if self.server.objetos.pop(chave, None) is None:
+                return 404, b'{"error": {"message": "Not Found"}}'
+            return 204, b""
+
+        def do_GET(self):
+            self.server.requisicoes += 1
+            time.sleep(latencia_ms / 1000)
+
+            caminho = urlsplit(self.path).path
+            match = OBJETO_RE.match(caminho) or PUBLICO_RE.match(caminho)
+            chave = (match.group(1), unquote(match.group(2))) if match else None
+            if chave not in self.server.objetos:
+                return self._responder(404, b'{"error": {"message": "Not Found"}}')
+
+            conteudo, content_type = self.server.objetos[chave]
+            if caminho.startswith("/storage/"):
+                return self._responder(200, self._recurso(*chave))
+
+            intervalo = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+            if intervalo:
+                inicio = int(intervalo.group(1))
+                fim = int(intervalo.group(2)) if intervalo.group(2) else len(conteudo) - 1
+                parte = conteudo[inicio:fim + 1]
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {inicio}-{inicio + len(parte) - 1}/{len(conteudo)}")
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(parte)))
+                self.end_headers()
+                self.wfile.write(parte)
+                return
+            self._responder(200, conteudo, content_type)
+
+        def do_DELETE(self):
+            self.server.requisicoes += 1
+            time.sleep(latencia_ms / 1000)
+
+            self._responder(*self._excluir(urlsplit(self.path).path))
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", porta), Handler)
+    servidor.daemon_threads = True
+    servidor.objetos = {}
+    servidor.requisicoes = 0
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}"
+
+if __name__ == "__main__":
+    porta = int(sys.argv[1]) if len(sys.argv) > 1 else 4443
+    servidor, url = start_fake_gcs(porta)
+    print(f"Storage local em {url}")
+    threading.Event().wait()
@@ -0,0 +1,72 @@
+"""
+Servidor HTTP local que imita o endpoint images:annotate da Google Vision.
+
+Responde cada imagem do lote com uma resposta gravada (arquivo JSON com o
+conteúdo de um item de `responses`) ou com uma anotação sintética mínima,
+após uma latência fixa por chamada mais um custo por imagem.
+
+Uso: python -m benchmarks.fake_vision [porta] [resposta.json]
+     VISION_URL=http://127.0.0.1:<porta> aponta a aplicação para ele.
+"""
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RESPOSTA_SINTETICA = {
+    "fullTextAnnotation": {
+        "text": "SUPERMERCADO EXEMPLO\nVALOR TOTAL R$ 123,45\n01/02/2025\n",
+        "pages": [{
+            "blocks": [{
+                "boundingBox": {"vertices": [{"x": 40, "y": 60}, {"x": 600, "y": 60},
+                                             {"x": 600, "y": 900}, {"x": 40, "y": 900}]}
+            }]
+        }],
+    }
+}
+
+def start_fake_vision(porta: int = 0, latencia_ms: float = 80, latencia_por_imagem_ms: float = 5,
+                      resposta: dict | None = None):
+    """Sobe o servidor numa thread e devolve (servidor, url_base)."""
+    resposta = resposta or RESPOSTA_SINTETICA
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            tamanho = int(self.headers.get("Content-Length", 0))
+            corpo = json.loads(self.rfile.read(tamanho) or b"{}")
+            quantidade = len(corpo.get("requests", []))
+
+            self.server.chamadas += 1
+            self.server.imagens += quantidade
+            time.sleep((latencia_ms + latencia_por_imagem_ms * quantidade) / 1000)
+
+            dados = json.dumps({"responses": [resposta] * quantidade}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", porta), Handler)
+    servidor.daemon_threads = True
+    servidor.chamadas = 0
+    servidor.imagens = 0
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}"
+
+if __name__ == "__main__":
+    porta = int(sys.argv[1]) if len(sys.argv) > 1 else 8081
+    resposta = json.load(open(sys.argv[2])) if len(sys.argv) > 2 else None
+    servidor, url = start_fake_vision(porta, resposta=resposta)
+    print(f"Vision local em {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.shutdown()
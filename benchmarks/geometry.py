@@ -0,0 +1,70 @@
+"""
+Micro-benchmark da correção de perspectiva por caminho.
+
+Compara, numa imagem sintética, a implementação anterior (caixa por list
+comprehension + warpPerspective sempre) com o recorte por fatia das notas
+alinhadas e com o warp pela inclinação dos blocos das notas inclinadas. Imprime um
+JSON com o tempo médio por imagem de cada caminho.
+
+Uso: python -m benchmarks.geometry [largura] [altura] [repeticoes]
+"""
+import json
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from app.services.geometry import correct_perspective
+
+def correct_perspective_anterior(img, vertices):
+    x_coords = [v[0] for v in vertices]
+    y_coords = [v[1] for v in vertices]
+    min_x, max_x = min(x_coords), max(x_coords)
+    min_y, max_y = min(y_coords), max(y_coords)
+
+    src_points = np.float32([[min_x, min_y], [max_x, min_y], [max_x, max_y], [min_x, max_y]])
+    dst_points = np.float32([[0, 0], [max_x - min_x, 0], [max_x - min_x, max_y - min_y], [0, max_y - min_y]])
+    matrix = cv2.getPerspectiveTransform(src_points, dst_points)
+    return cv2.warpPerspective(img, matrix, (int(max_x - min_x), int(max_y - min_y)))
+
+def vertices_blocos(largura, altura, angulo, blocos=60):
+    """Vértices de blocos de texto empilhados, girados `angulo` graus em torno do centro."""
+    rng = np.random.default_rng(0)
+    vertices = []
+    for i in range(blocos):
+        y = altura * 0.1 + i * altura * 0.8 / blocos
+        x0 = largura * 0.15 + rng.uniform(0, largura * 0.05)
+        x1 = largura * 0.85 - rng.uniform(0, largura * 0.05)
+        vertices += [(x0, y), (x1, y), (x1, y + 20), (x0, y + 20)]
+
+    centro = np.array([largura / 2, altura / 2])
+    rad = np.deg2rad(angulo)
+    rotacao = np.array([[np.cos(rad), -np.sin(rad)], [np.sin(rad), np.cos(rad)]])
+    pontos = (np.array(vertices) - centro) @ rotacao.T + centro
+    return [(int(x), int(y)) for x, y in pontos]
+
+def medir(funcao, img, vertices, repeticoes):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao(img, vertices)
+    return (time.perf_counter() - inicio) / repeticoes * 1000
+
+if __name__ == "__main__":
+    largura = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    altura = int(sys.argv[2]) if len(sys.argv) > 2 else 4000
+    repeticoes = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    img = np.random.default_rng(1).integers(0, 255, (altura, largura), dtype=np.uint8)
+    alinhada = vertices_blocos(largura, altura, 0)
+    inclinada = vertices_blocos(largura, altura, 8)
+
+    print(json.dumps({
+        "imagem": [largura, altura],
+        "ms_por_imagem": {
+            "anterior_alinhada": medir(correct_perspective_anterior, img, alinhada, repeticoes),
+            "fatia_alinhada": medir(correct_perspective, img, alinhada, repeticoes),
+            "anterior_inclinada": medir(correct_perspective_anterior, img, inclinada, repeticoes),
+            "warp_inclinada": medir(correct_perspective, img, inclinada, repeticoes),
+        },
+    }, indent=2))
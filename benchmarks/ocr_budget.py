@@ -0,0 +1,72 @@
+"""
+Valida o orçamento de OCR contra um corpus de notas rotuladas.
+
+O corpus é um diretório com as imagens e um `labels.json` no formato
+{"arquivo.jpg": {"valor": "12,34", "data": "01/02/2025"}}. Cada imagem é
+enviada à Vision com a imagem original e com a imagem reduzida ao orçamento
+candidato (pixels e bytes passados na linha de comando, qualidade em
+OCR_JPEG_QUALITY), e o resultado é um JSON com acurácia da extração, bytes
+enviados e latência de cada modo.
+
+Precisa de notas reais e da Vision real (API_KEY); o orçamento fica desligado
+em produção até este resultado ser registrado.
+
+Uso: python -m benchmarks.ocr_budget caminho/do/corpus [max_pixels] [max_bytes]
+"""
+import asyncio
+import json
+import mimetypes
+import sys
+import time
+from pathlib import Path
+from statistics import mean
+
+import app.services.scan as scan
+from app.services.vision import close_vision_client
+
+# Orçamento avaliado quando não for passado outro na linha de comando
+ORCAMENTO_CANDIDATO = (4_000_000, 1_500_000)
+
+async def executar(corpus: Path, max_pixels: int, max_bytes: int):
+    labels = json.loads((corpus / "labels.json").read_text())
+    limites = (scan.OCR_MAX_PIXELS, scan.OCR_MAX_BYTES)
+    scan.OCR_MAX_PIXELS, scan.OCR_MAX_BYTES = max_pixels, max_bytes
+
+    acertos, enviados, tempos = 0, [], []
+    try:
+        for arquivo, esperado in labels.items():
+            data = (corpus / arquivo).read_bytes()
+            image = scan.ScanImage(data, arquivo, mimetypes.guess_type(arquivo)[0])
+
+            inicio = time.perf_counter()
+            _, text, linhas = await scan.detect_text_and_contours(image)
+            tempos.append(time.perf_counter() - inicio)
+            enviados.append(image.metricas.get("ocr_bytes", len(data)))
+
+            valor, data_extraida = scan.extract_value_and_date_spatial(linhas, text or "")
+            if valor == esperado["valor"] and data_extraida == esperado["data"]:
+                acertos += 1
+    finally:
+        scan.OCR_MAX_PIXELS, scan.OCR_MAX_BYTES = limites
+
+    return {
+        "notas": len(labels),
+        "acuracia": acertos / len(labels) if labels else 0.0,
+        "bytes_medios": mean(enviados) if enviados else 0,
+        "latencia_media_s": mean(tempos) if tempos else 0.0,
+    }
+
+async def main(corpus: Path, max_pixels: int, max_bytes: int):
+    resultado = {
+        "original": await executar(corpus, 0, 0),
+        "orcamento": {"max_pixels": max_pixels, "max_bytes": max_bytes,
+                      **await executar(corpus, max_pixels, max_bytes)},
+    }
+    await close_vision_client()
+    print(json.dumps(resultado, indent=2))
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or not (Path(sys.argv[1]) / "labels.json").is_file():
+        sys.exit(__doc__)
+    argumentos = [int(valor) for valor in sys.argv[2:4]]
+    asyncio.run(main(Path(sys.argv[1]), *(argumentos + list(ORCAMENTO_CANDIDATO)[len(argumentos):])))
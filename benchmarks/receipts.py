@@ -0,0 +1,193 @@
+"""
+Gerador de notas fiscais sintéticas rotuladas.
+
+Cada nota é uma lista de linhas com rótulo à esquerda e valor à direita, como
+nos cupons reais, acompanhada do valor e da data esperados. A partir dela é
+montada uma `fullTextAnnotation` no formato da Google Vision, com rótulos e
+valores em blocos separados (o que afasta cada rótulo do seu valor no `text`).
+
+Também desenha a nota como uma foto (papel inclinado sobre um fundo, em
+várias resoluções e orientações) para os benchmarks do pipeline.
+
+Uso: python -m benchmarks.receipts [quantidade]  (grava benchmarks/fixtures/extracao.json)
+"""
+import json
+import random
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+LOJAS = ["SUPERMERCADO BOM PRECO", "POSTO CENTRAL LTDA", "PADARIA SAO JORGE", "FARMACIA POPULAR", "RESTAURANTE SABOR"]
+ITENS = ["ARROZ 5KG", "FEIJAO 1KG", "GASOLINA COMUM", "PAO FRANCES", "CAFE 500G", "REFRIGERANTE 2L", "DIPIRONA", "PRATO FEITO"]
+
+def reais(centavos: int) -> str:
+    return f"{centavos / 100:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+def gerar_nota(seed: int):
+    """Devolve (linhas, esperado); cada linha é (rótulo, valor ou None)."""
+    rng = random.Random(seed)
+    dia, mes = rng.randint(1, 28), rng.randint(1, 12)
+    data = f"{dia:02d}/{mes:02d}/2025"
+
+    linhas = [(rng.choice(LOJAS), None), (f"CNPJ {rng.randint(10, 99)}.{rng.randint(100, 999)}.{rng.randint(100, 999)}/0001-{rng.randint(10, 99)}", None)]
+    linhas.append((f"DATA {data} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}", None))
+
+    subtotal = 0
+    for _ in range(rng.randint(2, 12)):
+        preco = rng.randint(150, 25000)
+        subtotal += preco
+        linhas.append((rng.choice(ITENS), reais(preco)))
+
+    desconto = rng.choice([0, 0, rng.randint(100, 1000)])
+    total = subtotal - desconto
+    linhas.append(("SUBTOTAL", reais(subtotal)))
+    if desconto:
+        linhas.append(("DESCONTO", reais(desconto)))
+
+    formato = rng.choice(["mesma_linha", "linha_seguinte", "com_troco"])
+    if formato == "mesma_linha":
+        linhas.append(("VALOR TOTAL R$", reais(total)))
+    elif formato == "linha_seguinte":
+        linhas.append(("VALOR A PAGAR", None))
+        linhas.append(("R$", reais(total)))
+    else:
+        pago = (total // 5000 + 1) * 5000
+        linhas.append(("VALOR TOTAL R$", reais(total)))
+        linhas.append(("VALOR PAGO R$", reais(pago)))
+        linhas.append(("TROCO R$", reais(pago - total)))
+
+    linhas.append(("OBRIGADO PELA PREFERENCIA", None))
+    return linhas, {"valor": reais(total), "data": data}
+
+def _palavras(texto: str, x: int, y: int, largura_char: int = 12, altura: int = 20):
+    words = []
+    for palavra in texto.split():
+        largura = largura_char * len(palavra)
+        words.append({
+            "boundingBox": {"vertices": [{"x": x, "y": y}, {"x": x + largura, "y": y},
+                                         {"x": x + largura, "y": y + altura}, {"x": x, "y": y + altura}]},
+            "symbols": [{"text": c} for c in palavra],
+        })
+        x += largura + largura_char
+    return words
+
+def _bloco(words):
+    xs = [v["x"] for w in words for v in w["boundingBox"]["vertices"]]
+    ys = [v["y"] for w in words for v in w["boundingBox"]["vertices"]]
+    return {
+        "boundingBox": {"vertices": [{"x": min(xs), "y": min(ys)}, {"x": max(xs), "y": min(ys)},
+                                     {"x": max(xs), "y": max(ys)}, {"x": min(xs), "y": max(ys)}]},
+        "paragraphs": [{"words": words}],
+    }
+
+def anotacao_vision(linhas, inclinacao_px: float = 0.0):
+    """Monta a fullTextAnnotation com a coluna de rótulos e a de valores em blocos distintos."""
+    rotulos, valores = [], []
+    texto_rotulos, texto_valores = [], []
+    for i, (rotulo, valor) in enumerate(linhas):
+        y = 60 + i * 32
+        rotulos += _palavras(rotulo, 40, round(y + 40 * inclinacao_px))
+        texto_rotulos.append(rotulo)
+        if valor:
+            valores += _palavras(valor, 560, round(y + 560 * inclinacao_px))
+            texto_valores.append(valor)
+
+    blocos = [_bloco(rotulos)] + ([_bloco(valores)] if valores else [])
+    return {
+        "text": "\n".join(texto_rotulos + texto_valores) + "\n",
+        "pages": [{"width": 720, "height": 60 + len(linhas) * 32 + 60, "blocks": blocos}],
+    }
+
+def _caixa(vertices, dx=0):
+    return {"vertices": [{"x": v["x"] + dx, "y": v["y"]} for v in vertices]}
+
+def resposta_completa(linhas):
+    """
+    Item de `responses` como a DOCUMENT_TEXT_DETECTION devolve sem máscara de campos:
+    caixa, confiança e quebra em cada símbolo, além de `textAnnotations` por palavra.
+    """
+    annotation = anotacao_vision(linhas)
+    idioma = {"detectedLanguages": [{"languageCode": "pt", "confidence": 0.98}]}
+    text_annotations = [{"locale": "pt", "description": annotation["text"],
+                         "boundingPoly": annotation["pages"][0]["blocks"][0]["boundingBox"]}]
+
+    for block in annotation["pages"][0]["blocks"]:
+        block.update(property=idioma, blockType="TEXT", confidence=0.97)
+        for paragraph in block["paragraphs"]:
+            paragraph.update(property=idioma, boundingBox=block["boundingBox"], confidence=0.97)
+            for word in paragraph["words"]:
+                vertices = word["boundingBox"]["vertices"]
+                largura = (vertices[1]["x"] - vertices[0]["x"]) // len(word["symbols"])
+                word.update(property=idioma, confidence=0.96)
+                for i, symbol in enumerate(word["symbols"]):
+                    base = [{"x": vertices[0]["x"], "y": v["y"]} for v in vertices]
+                    symbol.update(property=idioma, confidence=0.95,
+                                  boundingBox=_caixa(base, largura * i))
+                word["symbols"][-1]["property"] = {**idioma, "detectedBreak": {"type": "SPACE"}}
+                text_annotations.append({
+                    "description": "".join(symbol["text"] for symbol in word["symbols"]),
+                    "boundingPoly": word["boundingBox"],
+                })
+
+    annotation["pages"][0]["property"] = idioma
+    return {"textAnnotations": text_annotations, "fullTextAnnotation": annotation}
+
+ROTACOES = {0: None, 90: cv2.ROTATE_90_CLOCKWISE, 180: cv2.ROTATE_180, 270: cv2.ROTATE_90_COUNTERCLOCKWISE}
+
+def gerar_imagem(linhas, largura: int, altura: int, rotacao: int = 0, seed: int = 0, qualidade: int = 90) -> bytes:
+    """
+    Desenha a nota num papel branco, aplica uma perspectiva leve sobre um fundo
+    texturizado e devolve o JPEG com `largura` x `altura` já girado de `rotacao` graus.
+    """
+    rng = np.random.default_rng(seed)
+
+    papel = np.full((90 + len(linhas) * 32, 720, 3), 250, np.uint8)
+    for i, (rotulo, valor) in enumerate(linhas):
+        y = 76 + i * 32
+        cv2.putText(papel, rotulo, (40, y), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (30, 30, 30), 1, cv2.LINE_AA)
+        if valor:
+            cv2.putText(papel, valor, (560, y), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (30, 30, 30), 1, cv2.LINE_AA)
+
+    # Em retrato; a rotação pedida é aplicada no fim
+    if rotacao in (90, 270):
+        largura, altura = altura, largura
+
+    foto = rng.integers(60, 110, (altura, largura, 3), dtype=np.uint8)
+    foto = cv2.GaussianBlur(foto, (0, 0), 3)
+
+    proporcao = papel.shape[0] / papel.shape[1]
+    alt_nota = min(altura * 0.85, largura * 0.7 * proporcao)
+    larg_nota = alt_nota / proporcao
+    cx, cy = largura / 2, altura / 2
+    jitter = lambda: rng.uniform(-0.03, 0.03) * larg_nota
+    destino = np.float32([
+        [cx - larg_nota / 2 + jitter(), cy - alt_nota / 2 + jitter()],
+        [cx + larg_nota / 2 + jitter(), cy - alt_nota / 2 + jitter()],
+        [cx + larg_nota / 2 + jitter(), cy + alt_nota / 2 + jitter()],
+        [cx - larg_nota / 2 + jitter(), cy + alt_nota / 2 + jitter()],
+    ])
+    origem = np.float32([[0, 0], [papel.shape[1], 0], [papel.shape[1], papel.shape[0]], [0, papel.shape[0]]])
+    matriz = cv2.getPerspectiveTransform(origem, destino)
+    cv2.warpPerspective(papel, matriz, (largura, altura), dst=foto, borderMode=cv2.BORDER_TRANSPARENT)
+
+    if ROTACOES[rotacao] is not None:
+        foto = cv2.rotate(foto, ROTACOES[rotacao])
+
+    _, encoded = cv2.imencode(".jpg", foto, [cv2.IMWRITE_JPEG_QUALITY, qualidade])
+    return encoded.tobytes()
+
+def gerar_corpus(quantidade: int):
+    corpus = []
+    for seed in range(quantidade):
+        linhas, esperado = gerar_nota(seed)
+        corpus.append({"fullTextAnnotation": anotacao_vision(linhas), "esperado": esperado})
+    return corpus
+
+if __name__ == "__main__":
+    quantidade = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    FIXTURES.mkdir(exist_ok=True)
+    (FIXTURES / "extracao.json").write_text(json.dumps(gerar_corpus(quantidade), separators=(",", ":")))
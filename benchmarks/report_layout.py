@@ -0,0 +1,102 @@
+"""
+Tempo e memória da geração do relatório em PDF conforme o número de notas.
+
+Popula um SQLite em memória com N notas numa planilha e mede gerar_pdf (leitura
+em blocos + uma tabela por página). Para os tamanhos menores mede também o
+layout anterior, com todas as notas carregadas e uma única tabela dividida pelo
+reportlab, para comparação.
+
+O tempo por nota deve ficar estável entre os tamanhos. O pico de memória do layout
+atual acompanha o número de páginas (o reportlab guarda o conteúdo de cada página,
+~8KB, até salvar o arquivo), não o de notas carregadas.
+
+Uso: python -m benchmarks.report_layout [notas ...]
+"""
+import asyncio
+import io
+import random
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from reportlab.lib.pagesizes import LETTER
+from reportlab.platypus import SimpleDocTemplate, Table
+from tortoise import Tortoise
+
+from app.models import Categoria, Nota, Planilha, Usuario
+from app.services.report import (
+    LARGURAS_NOTAS, CABECALHO_NOTAS, carregar_cabecalho_relatorio, estilo_tabela_notas,
+    footer, formatar_valor, gerar_pdf,
+)
+
+TAMANHOS = (1_000, 10_000, 100_000)
+LIMITE_LEGADO = 10_000  # acima disso o layout anterior leva minutos
+
+async def popular(quantidade: int, seed: int = 0):
+    aleatorio = random.Random(seed)
+    usuario = await Usuario.create(codigo_usuario=f"u{quantidade}", senha="x", nome="Benchmark",
+                                   email=f"u{quantidade}@benchmark", caixa=0)
+    planilha = await Planilha.create(codigo_planilha=f"P{quantidade}", codigo_usuario=usuario)
+    categorias = [await Categoria.get_or_create(codigo_categoria=i, defaults={"descricao": f"Categoria {i}"})
+                  for i in range(1, 6)]
+    inicio = date(2025, 1, 1)
+
+    for bloco in range(0, quantidade, 5_000):
+        await Nota.bulk_create([
+            Nota(url_image_original="", url_image_scan="", descricao="", codigo_usuario=usuario, planilha=planilha,
+                 codigo_categoria=aleatorio.choice(categorias)[0], valor=aleatorio.randint(100, 500_000),
+                 data=inicio + timedelta(days=aleatorio.randint(0, 365)))
+            for _ in range(bloco, min(bloco + 5_000, quantidade))
+        ])
+    return usuario.codigo_usuario, planilha.codigo_planilha
+
+async def relatorio_legado(codigo_usuario, codigo_planilha) -> bytes:
+    """Layout anterior: todas as notas em memória e uma só tabela dividida pelo reportlab."""
+    cabecalho = await carregar_cabecalho_relatorio(codigo_usuario, codigo_planilha)
+    notas = await (Nota.filter(codigo_usuario=codigo_usuario, planilha_id=cabecalho["planilha_id"])
+                   .select_related("codigo_categoria").order_by("-created_at"))
+    linhas = [[nota.id, nota.codigo_categoria.descricao, formatar_valor(nota.valor), nota.data.strftime('%d/%m/%Y')]
+              for nota in notas]
+
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=LETTER, rightMargin=40, leftMargin=40, topMargin=40, bottomMargin=40)
+    tabela = Table([CABECALHO_NOTAS] + linhas, colWidths=LARGURAS_NOTAS, style=estilo_tabela_notas, repeatRows=1)
+    doc.build([tabela], onFirstPage=footer, onLaterPages=footer)
+    return buffer.getvalue()
+
+async def relatorio_atual(codigo_usuario, codigo_planilha) -> bytes:
+    cabecalho = await carregar_cabecalho_relatorio(codigo_usuario, codigo_planilha)
+    return await gerar_pdf(cabecalho)
+
+async def medir(gerar, codigo_usuario, codigo_planilha) -> dict:
+    # Tempo e memória em execuções separadas: o tracemalloc deixa o reportlab ~10x mais lento
+    inicio = time.perf_counter()
+    pdf = await gerar(codigo_usuario, codigo_planilha)
+    duracao = time.perf_counter() - inicio
+
+    tracemalloc.start()
+    await gerar(codigo_usuario, codigo_planilha)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"s": duracao, "pico_mb": pico / 2**20, "kb": len(pdf) / 1024, "paginas": pdf.count(b"/Type /Page\n")}
+
+async def main(tamanhos):
+    await Tortoise.init(db_url="sqlite://:memory:", modules={"models": ["app.models"]})
+    await Tortoise.generate_schemas()
+    try:
+        print(f"{'notas':>8} {'layout':>7} {'tempo':>9} {'us/nota':>8} {'pico':>9} {'páginas':>8} {'tamanho':>10}")
+        for quantidade in tamanhos:
+            codigos = await popular(quantidade)
+            layouts = [("atual", relatorio_atual)]
+            if quantidade <= LIMITE_LEGADO:
+                layouts.append(("legado", relatorio_legado))
+            for nome, gerar in layouts:
+                r = await medir(gerar, *codigos)
+                print(f"{quantidade:>8} {nome:>7} {r['s']:>8.2f}s {r['s'] / quantidade * 1e6:>8.0f} "
+                      f"{r['pico_mb']:>7.1f}MB {r['paginas']:>8} {r['kb']:>8.0f}KB")
+    finally:
+        await Tortoise.close_connections()
+
+if __name__ == "__main__":
+    asyncio.run(main([int(n) for n in sys.argv[1:]] or TAMANHOS))
@@ -0,0 +1,233 @@
+"""
+Benchmark do pipeline de digitalização (app/services/scan.py) sem Vision nem bucket reais.
+
+Gera notas sintéticas em várias resoluções e orientações, sobe o servidor local
+da Vision (benchmarks.fake_vision, respondendo com uma resposta gravada) e o
+emulador de storage (benchmarks.fake_gcs), e mede:
+
+- latência por etapa (decode, base64, ocr, warp, preprocess, encode, upload),
+  executando as etapas uma a uma para cada imagem;
+- vazão e latência do execute_scan completo com N clientes concorrentes;
+- pico de memória de cada execute_scan, medido com tracemalloc, uma nota por
+  vez e por resolução. Conta as alocações do Python e dos arrays NumPy/OpenCV
+  (os buffers internos do OpenCV não), em todas as threads do processo; com
+  SCAN_POOL=process as etapas de CPU rodam em outros processos e ficam de fora.
+
+O resultado é um JSON (stdout ou --saida) com o commit medido; --comparar
+imprime a variação em relação a um resultado anterior.
+
+Uso: python -m benchmarks.scan_pipeline [--clientes 1 4 16] [--scans 48]
+                                         [--saida resultado.json] [--comparar base.json]
+"""
+import argparse
+import asyncio
+import json
+import subprocess
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+import cv2
+import numpy as np
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import storage
+from tortoise import Tortoise
+
+import app.services.gcs as gcs
+import app.services.vision as vision
+from app.core.config import SCAN_JPEG_QUALITY, MEDIUM_MAX_SIDE, THUMB_MAX_SIDE, SCAN_POOL, SCAN_WORKERS
+from app.services.geometry import correct_perspective
+from app.services.scan import (
+    ScanImage, build_vision_request, parse_vision_response, preprocess_image, resize_max_side,
+    encode_derivative, execute_scan,
+)
+from app.services.vision import VisionClient, post_annotate
+from benchmarks.fake_gcs import start_fake_gcs
+from benchmarks.fake_vision import start_fake_vision
+from benchmarks.receipts import gerar_imagem, gerar_nota, resposta_completa
+from benchmarks.vision_batching import percentil
+from benchmarks.vision_parsing import aplicar_mascara
+
+RESOLUCOES = [(1200, 1600), (2448, 3264), (3024, 4032)]
+ORIENTACOES = [0, 90, 180, 270]
+ETAPAS = ["decode", "base64", "ocr", "warp", "preprocess", "encode", "upload"]
+
+@contextmanager
+def cronometro(tempos: dict, etapa: str):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        tempos.setdefault(etapa, []).append((time.perf_counter() - inicio) * 1000)
+
+def resumo(valores):
+    return {
+        "p50": round(percentil(valores, 50), 2),
+        "p95": round(percentil(valores, 95), 2),
+        "p99": round(percentil(valores, 99), 2),
+        "media": round(sum(valores) / len(valores), 2),
+    }
+
+def gerar_imagens():
+    imagens = []
+    for i, (largura, altura) in enumerate(RESOLUCOES):
+        for j, rotacao in enumerate(ORIENTACOES):
+            seed = i * len(ORIENTACOES) + j
+            imagens.append((f"{largura}x{altura}_{rotacao}", gerar_imagem(gerar_nota(seed)[0], largura, altura, rotacao, seed)))
+    return imagens
+
+async def medir_etapas(imagens, repeticoes: int):
+    """Executa cada etapa isoladamente, na ordem do pipeline, e registra a duração."""
+    tempos = {}
+    for _ in range(repeticoes):
+        for nome, dados in imagens:
+            image = ScanImage(dados, f"{nome}.jpg", "image/jpeg")
+
+            with cronometro(tempos, "base64"):
+                vision_request, escala = build_vision_request(image)
+            with cronometro(tempos, "ocr"):
+                respostas = await post_annotate([vision_request])
+                vertices, _, _ = parse_vision_response(respostas[0], escala)
+
+            with cronometro(tempos, "decode"):
+                img = cv2.imdecode(np.frombuffer(dados, np.uint8), cv2.IMREAD_COLOR)
+            with cronometro(tempos, "warp"):
+                recorte = correct_perspective(img, vertices)
+            with cronometro(tempos, "preprocess"):
+                img_scan = preprocess_image(recorte)
+            with cronometro(tempos, "encode"):
+                _, scan = cv2.imencode(".jpg", img_scan, [cv2.IMWRITE_JPEG_QUALITY, SCAN_JPEG_QUALITY])
+                img_medium = resize_max_side(img_scan, MEDIUM_MAX_SIDE)
+                derivados = [encode_derivative(img_medium), encode_derivative(resize_max_side(img_medium, THUMB_MAX_SIDE))]
+
+            with cronometro(tempos, "upload"):
+                await asyncio.gather(*[
+                    gcs.upload_to_gcs_async(ScanImage(conteudo, f"{variante}_{nome}.jpg", content_type))
+                    for variante, (conteudo, content_type) in zip(("scan", "medium", "thumb"),
+                                                                  [(scan.tobytes(), "image/jpeg"), *derivados])
+                ])
+
+    return {etapa: resumo(tempos[etapa]) for etapa in ETAPAS}
+
+async def medir_concorrencia(imagens, clientes: int, scans: int):
+    """execute_scan completo com `clientes` chamadores concorrentes, sem acertos no cache de OCR."""
+    latencias, etapas = [], {}
+    fila = iter(range(scans))
+
+    async def cliente():
+        for i in fila:
+            nome, dados = imagens[i % len(imagens)]
+            image = ScanImage(dados, f"{nome}.jpg", "image/jpeg")
+            image._sha256 = uuid.uuid4().hex  # cada envio conta como uma foto nova
+
+            inicio = time.perf_counter()
+            await execute_scan(image)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            for etapa, (comeco, fim) in image.metricas["etapas_ms"].items():
+                etapas.setdefault(etapa, []).append(fim - comeco)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*[cliente() for _ in range(clientes)])
+    duracao = time.perf_counter() - inicio
+
+    return {
+        "clientes": clientes,
+        "scans": scans,
+        "vazao_sps": round(scans / duracao, 2),
+        "latencia_ms": resumo(latencias),
+        "etapas_ms": {etapa: resumo(valores) for etapa, valores in etapas.items()},
+    }
+
+async def medir_memoria(imagens):
+    """Pico de memória alocada durante um execute_scan, por resolução, uma nota por vez."""
+    picos = {}
+    tracemalloc.start()
+    try:
+        for nome, dados in imagens:
+            image = ScanImage(dados, f"{nome}.jpg", "image/jpeg")
+            image._sha256 = uuid.uuid4().hex
+
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            await execute_scan(image)
+            pico = tracemalloc.get_traced_memory()[1] - base
+            picos.setdefault(nome.split("_")[0], []).append(pico / 2**20)
+    finally:
+        tracemalloc.stop()
+
+    return {resolucao: {"pico_mb": round(max(valores), 2), "media_mb": round(sum(valores) / len(valores), 2)}
+            for resolucao, valores in picos.items()}
+
+def commit_atual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+def comparar(base: dict, atual: dict):
+    """Variação percentual do p50 de cada etapa e da vazão de cada nível de concorrência."""
+    variacao = lambda antes, depois: f"{(depois - antes) / antes * 100:+.1f}%" if antes else "n/a"
+    linhas = [f"{base.get('commit')} -> {atual.get('commit')}"]
+    for etapa, valores in atual["etapas_ms"].items():
+        if etapa in base["etapas_ms"]:
+            linhas.append(f"  {etapa:<12} p50 {variacao(base['etapas_ms'][etapa]['p50'], valores['p50'])}")
+    anteriores = {c["clientes"]: c for c in base["concorrencia"]}
+    for nivel in atual["concorrencia"]:
+        if nivel["clientes"] in anteriores:
+            linhas.append(f"  {nivel['clientes']:>3} clientes vazão {variacao(anteriores[nivel['clientes']]['vazao_sps'], nivel['vazao_sps'])}")
+    return "\n".join(linhas)
+
+async def main(args):
+    resposta = aplicar_mascara(resposta_completa(gerar_nota(0)[0]))
+    if args.resposta:
+        resposta = json.loads(Path(args.resposta).read_text())
+
+    _, url_vision = start_fake_vision(latencia_ms=args.latencia_vision_ms, resposta=resposta)
+    _, url_gcs = start_fake_gcs(latencia_ms=args.latencia_gcs_ms)
+
+    vision.vision_client = VisionClient(base_url=url_vision, api_key="local", taxa=0)
+    gcs._bucket = storage.Client(
+        project="benchmark", credentials=AnonymousCredentials(), client_options={"api_endpoint": url_gcs},
+    ).bucket("benchmark")
+    await Tortoise.init(db_url="sqlite://:memory:", modules={"models": ["app.models"]})
+    await Tortoise.generate_schemas()
+
+    try:
+        imagens = gerar_imagens()
+        resultado = {
+            "commit": commit_atual(),
+            "configuracao": {
+                "imagens": [nome for nome, _ in imagens],
+                "scan_pool": SCAN_POOL,
+                "scan_workers": SCAN_WORKERS,
+                "latencia_vision_ms": args.latencia_vision_ms,
+                "latencia_gcs_ms": args.latencia_gcs_ms,
+            },
+            "etapas_ms": await medir_etapas(imagens, args.repeticoes),
+            "concorrencia": [await medir_concorrencia(imagens, n, args.scans) for n in args.clientes],
+            "memoria_por_scan": await medir_memoria(imagens),
+        }
+    finally:
+        await vision.close_vision_client()
+        await Tortoise.close_connections()
+
+    saida = json.dumps(resultado, indent=2)
+    if args.saida:
+        Path(args.saida).write_text(saida)
+    print(saida)
+    if args.comparar:
+        print(comparar(json.loads(Path(args.comparar).read_text()), resultado))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clientes", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--scans", type=int, default=48, help="execuções por nível de concorrência")
+    parser.add_argument("--repeticoes", type=int, default=2, help="passadas por imagem na medição por etapa")
+    parser.add_argument("--latencia-vision-ms", type=float, default=80)
+    parser.add_argument("--latencia-gcs-ms", type=float, default=20)
+    parser.add_argument("--resposta", help="resposta gravada da Vision (um item de `responses`)")
+    parser.add_argument("--saida", help="grava o JSON neste arquivo")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para comparação")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,68 @@
+"""
+Mede o agrupamento de chamadas à Vision contra o servidor local de benchmarks.fake_vision.
+
+Dispara REQUISICOES anotações com CLIENTES chamadores concorrentes para cada
+configuração de janela/tamanho de lote e imprime um JSON com vazão, latências
+(p50/p95) e número de chamadas HTTP feitas.
+
+Uso: python -m benchmarks.vision_batching [requisicoes] [clientes]
+"""
+import asyncio
+import json
+import sys
+import time
+
+import app.services.vision as vision
+from benchmarks.fake_vision import start_fake_vision
+
+CONFIGURACOES = [
+    {"janela_ms": 0, "max_lote": 1},
+    {"janela_ms": 5, "max_lote": 16},
+    {"janela_ms": 20, "max_lote": 16},
+    {"janela_ms": 50, "max_lote": 16},
+]
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(p / 100 * len(valores)))]
+
+async def medir(batcher, requisicoes: int, clientes: int):
+    vision_request = {"image": {"content": "A" * 200_000}, "features": [{"type": "DOCUMENT_TEXT_DETECTION"}]}
+    latencias = []
+    fila = iter(range(requisicoes))
+
+    async def cliente():
+        for _ in fila:
+            inicio = time.perf_counter()
+            await batcher.annotate(vision_request)
+            latencias.append(time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente() for _ in range(clientes)))
+    total = time.perf_counter() - inicio
+
+    return {
+        "vazao_rps": requisicoes / total,
+        "p50_ms": percentil(latencias, 50) * 1000,
+        "p95_ms": percentil(latencias, 95) * 1000,
+        "chamadas_http": batcher.chamadas,
+    }
+
+async def main(requisicoes: int, clientes: int):
+    servidor, url = start_fake_vision()
+    vision.vision_client = vision.VisionClient(base_url=url, api_key="local", taxa=0)
+    await vision.vision_client.start()
+
+    resultados = []
+    for config in CONFIGURACOES:
+        batcher = vision.VisionBatcher(**config)
+        resultados.append({**config, **await medir(batcher, requisicoes, clientes)})
+
+    await vision.vision_client.close()
+    servidor.shutdown()
+    print(json.dumps({"requisicoes": requisicoes, "clientes": clientes, "resultados": resultados}, indent=2))
+
+if __name__ == "__main__":
+    requisicoes = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    clientes = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    asyncio.run(main(requisicoes, clientes))
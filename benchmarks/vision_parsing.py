@@ -0,0 +1,74 @@
+"""
+Tamanho e custo de decodificação da resposta da Vision, com e sem máscara de campos.
+
+Compara `response.json()` sobre a resposta completa com a decodificação enxuta
+(parse_annotate_body) sobre a resposta completa e sobre a resposta restrita por
+VISION_FIELDS. Usa lotes sintéticos de benchmarks.receipts ou uma resposta gravada
+(arquivo JSON com o corpo de images:annotate).
+
+Uso: python -m benchmarks.vision_parsing [imagens_por_lote] [resposta.json]
+"""
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from app.services.extract import extract_lines
+from app.services.vision import parse_annotate_body
+from benchmarks.receipts import gerar_nota, resposta_completa
+
+def aplicar_mascara(item: dict) -> dict:
+    """Reproduz localmente o recorte feito pela API com o VISION_FIELDS padrão."""
+    annotation = item.get("fullTextAnnotation")
+    if annotation is None:
+        return {k: v for k, v in item.items() if k == "error"}
+
+    return {"fullTextAnnotation": {
+        "text": annotation.get("text", ""),
+        "pages": [{"blocks": [{
+            "boundingBox": block.get("boundingBox", {}),
+            "paragraphs": [{"words": [{
+                "boundingBox": word.get("boundingBox", {}),
+                "symbols": [{"text": symbol.get("text", "")} for symbol in word.get("symbols", [])],
+            } for word in paragraph.get("words", [])]} for paragraph in block.get("paragraphs", [])],
+        } for block in page.get("blocks", [])]} for page in annotation.get("pages", [])],
+    }}
+
+def medir(decodificar, corpo: bytes, repeticoes: int = 20):
+    tracemalloc.start()
+    dados = decodificar(corpo)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        decodificar(corpo)
+    duracao = (time.perf_counter() - inicio) / repeticoes
+
+    linhas = [extract_lines(r.get("fullTextAnnotation", {})) for r in dados.get("responses", [])]
+    return {"bytes": len(corpo), "parse_ms": round(duracao * 1000, 2),
+            "pico_memoria_kb": pico // 1024}, linhas
+
+if __name__ == "__main__":
+    imagens = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    if len(sys.argv) > 2:
+        completa = json.loads(Path(sys.argv[2]).read_text())
+    else:
+        completa = {"responses": [resposta_completa(gerar_nota(seed)[0]) for seed in range(imagens)]}
+
+    corpo_completo = json.dumps(completa).encode()
+    corpo_mascarado = json.dumps({"responses": [aplicar_mascara(r) for r in completa["responses"]]}).encode()
+
+    resultados = {}
+    referencia = None
+    for nome, decodificar, corpo in [
+        ("completa_json", json.loads, corpo_completo),
+        ("completa_enxuta", parse_annotate_body, corpo_completo),
+        ("mascarada_enxuta", parse_annotate_body, corpo_mascarado),
+    ]:
+        resultados[nome], linhas = medir(decodificar, corpo)
+        referencia = referencia or linhas
+        assert linhas == referencia, f"{nome}: linhas diferentes da resposta completa"
+
+    print(json.dumps({"imagens": len(completa["responses"]), **resultados}, indent=2))
@@ -0,0 +1,15 @@
+from datetime import date, datetime
+
+from app.services.export import _linha_csv
+
+def test_csv_neutraliza_formulas_nos_textos():
+    linha = _linha_csv(1, date(2025, 2, 1), 3, "@Comb", "=HYPERLINK(\"x\")", -1250,
+                       datetime(2025, 2, 1, 12), "https://s/a")
+
+    assert linha[3:6] == ["'@Comb", "'=HYPERLINK(\"x\")", "-12.50"]
+    assert linha[7] == "https://s/a"
+
+def test_csv_mantem_textos_comuns():
+    linha = _linha_csv(1, date(2025, 2, 1), 3, "Combustível", "Posto 24h", 990, datetime(2025, 2, 1), None)
+
+    assert linha[3:6] == ["Combustível", "Posto 24h", "9.90"]
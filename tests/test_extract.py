@@ -0,0 +1,14 @@
+from app.services.extract import extract_value_and_date, extract_value_and_date_spatial
+
+def test_valor_seguido_de_pontuacao():
+    assert extract_value_and_date("VALOR TOTAL: 10,00.")[0] == "10,00"
+    assert extract_value_and_date("TOTAL R$10,00-")[0] == "10,00"
+
+def test_valor_nao_casa_pedaco_de_cnpj():
+    assert extract_value_and_date("CNPJ 12.345.678/0001-90\nVALOR TOTAL 7,50")[0] == "7,50"
+
+def test_data_iso_com_e_sem_linhas():
+    texto = "VALOR PAGO R$ 25,90\nData 2025-02-01"
+
+    assert extract_value_and_date_spatial([], texto) == ("25,90", "01/02/2025")
+    assert extract_value_and_date_spatial(texto.split("\n"), texto) == ("25,90", "01/02/2025")
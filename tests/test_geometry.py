@@ -0,0 +1,39 @@
+import numpy as np
+
+from app.services.geometry import correct_perspective, skew_angle, vertices_array
+
+def box(x0, y0, x1, y1):
+    return [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+
+def girar(vertices, angulo, centro=(600, 800)):
+    rad = np.deg2rad(angulo)
+    rotacao = np.array([[np.cos(rad), -np.sin(rad)], [np.sin(rad), np.cos(rad)]])
+    pontos = (np.array(vertices, dtype=float) - centro) @ rotacao.T + centro
+    return [(float(x), float(y)) for x, y in pontos]
+
+def imagem():
+    return np.zeros((1600, 1200, 3), np.uint8)
+
+def test_layout_esparso_reto_recorta_pela_caixa():
+    # Cabeçalho no canto superior esquerdo e total alinhado à direita embaixo:
+    # o retângulo mínimo sobre todos os cantos sai a ~65°, mas a nota está reta
+    vertices = box(100, 100, 400, 160) + box(700, 1400, 950, 1460)
+
+    assert skew_angle(vertices_array(vertices), 2) == 0
+    assert correct_perspective(imagem(), vertices).shape[:2] == (1360, 850)
+
+def test_nota_inclinada_e_endireitada():
+    vertices = girar(sum((box(200, 200 + i * 60, 1000, 240 + i * 60) for i in range(20)), []), 8)
+
+    assert abs(skew_angle(vertices_array(vertices), 2) - 8) < 0.01
+    altura, largura = correct_perspective(imagem(), vertices).shape[:2]
+    assert abs(largura - 800) <= 2 and abs(altura - 1180) <= 2
+
+def test_blocos_discordantes_recortam_pela_caixa():
+    vertices = girar(box(100, 100, 400, 160), 20, (250, 130)) + girar(box(700, 1400, 950, 1460), -15, (825, 1430))
+
+    assert skew_angle(vertices_array(vertices), 2) is None
+    pontos = vertices_array(vertices)
+    altura, largura = correct_perspective(imagem(), vertices).shape[:2]
+    assert (altura, largura) == (int(np.ceil(pontos[:, 1].max())) - int(np.floor(pontos[:, 1].min())),
+                                 int(np.ceil(pontos[:, 0].max())) - int(np.floor(pontos[:, 0].min())))